@@ -0,0 +1,254 @@
+import os
+import json
+import time
+from tabulate import tabulate
+from loguru import logger
+from parsers.nb_parser import NotebookParser, REFORMAT_CACHE, _reformat_code_lines_uncached
+from parsers.log_parser import LogParser, iter_log_entries
+from utils import get_all_file_with_extension_in_dir_recursively
+
+
+def _timeit(fn, repeat=5) -> float:
+    # best of `repeat` runs, in milliseconds
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def benchmark_nb_parse(notebooks_dir, repeat=5, **kwargs) -> str:
+    table = []
+    for nb_filepath in sorted(get_all_file_with_extension_in_dir_recursively(notebooks_dir, '.ipynb')):
+        def _parse(lazy_outputs=False):
+            REFORMAT_CACHE.clear() # NOTE: cold start, nothing memoized
+            return NotebookParser(nb_filepath, lazy_outputs=lazy_outputs)
+
+        def _parse_and_normalize():
+            for cell in _parse():
+                cell.source
+
+        nb_parser = _parse()
+        num_code_cells = sum(cell.cell_type == 'code' for cell in nb_parser)
+        table.append([
+            os.path.basename(nb_filepath),
+            len(nb_parser),
+            num_code_cells,
+            os.path.getsize(nb_filepath) / 1024**2,
+            _timeit(_parse, repeat=repeat),
+            _timeit(lambda: _parse(lazy_outputs=True), repeat=repeat),
+            _timeit(_parse_and_normalize, repeat=repeat),
+        ])
+    return tabulate(
+        table,
+        headers=['notebook', '# cells', '# code cells', 'size (MB)', 'parse (ms)', 'parse lazy outputs (ms)', 'parse + normalize all (ms)'],
+        floatfmt='.2f'
+    )
+
+
+def benchmark_reformat(notebooks_dir, repeat=5, **kwargs) -> str:
+    from legacy.legacy_nb_parser import reformat_code_lines as legacy_reformat_code_lines
+
+    def _reformat_all(reformat_fn, sources):
+        for source in sources:
+            reformat_fn(source)
+
+    table = []
+    for nb_filepath in sorted(get_all_file_with_extension_in_dir_recursively(notebooks_dir, '.ipynb')):
+        with open(nb_filepath) as f:
+            cells = json.load(f)['cells']
+        sources = []
+        for cell in cells:
+            if cell['cell_type'] != 'code':
+                continue
+            try:
+                # NOTE: only cells both implementations can handle are compared
+                if legacy_reformat_code_lines(cell['source']) != _reformat_code_lines_uncached(cell['source']):
+                    logger.warning(f'Different reformatted source of cell {cell.get("id")} in {nb_filepath}')
+                sources.append(cell['source'])
+            except Exception:
+                continue
+        num_comment_lines = sum(line.startswith('#') for source in sources for line in source)
+        legacy_ms = _timeit(lambda: _reformat_all(legacy_reformat_code_lines, sources), repeat=repeat)
+        new_ms = _timeit(lambda: _reformat_all(_reformat_code_lines_uncached, sources), repeat=repeat)
+        table.append([
+            os.path.basename(nb_filepath),
+            len(sources),
+            num_comment_lines,
+            legacy_ms,
+            new_ms,
+            legacy_ms / new_ms if new_ms else float('nan'),
+        ])
+    return tabulate(
+        table,
+        headers=['notebook', '# code cells', '# comment lines', 'legacy (ms)', 'tokenize (ms)', 'speedup'],
+        floatfmt='.2f'
+    )
+
+
+def benchmark_diff(notebooks_dir, repeat=5, num_cells=10, **kwargs) -> str:
+    import difflib
+    import random
+    from nb_diff import diff_lines
+
+    def _edit(lines, seed):
+        # deterministic mix of deleted, inserted and modified lines
+        rng = random.Random(seed)
+        edited_lines = []
+        for line in lines:
+            action = rng.random()
+            if action < 0.05:
+                continue
+            if action < 0.10:
+                edited_lines.append(f'{line} # modified')
+            else:
+                edited_lines.append(line)
+            if rng.random() < 0.05:
+                edited_lines.append('inserted_line = None')
+        return edited_lines
+
+    def _num_edited_lines(opcodes):
+        return sum((i2 - i1) + (j2 - j1) for tag, i1, i2, j1, j2 in opcodes if tag != 'equal')
+
+    cells = []
+    for nb_filepath in sorted(get_all_file_with_extension_in_dir_recursively(notebooks_dir, '.ipynb')):
+        for cell in NotebookParser(nb_filepath):
+            if cell.cell_type != 'code':
+                continue
+            try:
+                cells.append((nb_filepath, cell.cell_id, cell.source))
+            except Exception:
+                continue
+    # NOTE: the largest cells only
+    cells = sorted(cells, key=lambda cell: len(cell[2]), reverse=True)[:num_cells]
+
+    table = []
+    for nb_filepath, cell_id, source in cells:
+        edited_source = _edit(source, seed=cell_id)
+        difflib_opcodes = difflib.SequenceMatcher(None, source, edited_source, autojunk=False).get_opcodes()
+        myers_opcodes = diff_lines(source, edited_source)
+        difflib_ms = _timeit(lambda: difflib.SequenceMatcher(None, source, edited_source, autojunk=False).get_opcodes(), repeat=repeat)
+        myers_ms = _timeit(lambda: diff_lines(source, edited_source), repeat=repeat)
+        table.append([
+            f'{os.path.basename(nb_filepath)}:{cell_id}',
+            len(source),
+            _num_edited_lines(difflib_opcodes),
+            _num_edited_lines(myers_opcodes),
+            difflib_ms,
+            myers_ms,
+            difflib_ms / myers_ms if myers_ms else float('nan'),
+        ])
+    return tabulate(
+        table,
+        headers=['cell', '# lines', 'difflib edited lines', 'myers edited lines', 'difflib (ms)', 'myers (ms)', 'speedup'],
+        floatfmt='.2f'
+    )
+
+
+def benchmark_log_parse(logs_dir, repeat=5, **kwargs) -> str:
+    from parsers.log_parser import _convert_to_ms
+    import tempfile
+    from parsers.log_columns import ColumnarLogStore, LogCache, convert_to_ms_bulk
+    from nb_progress import PROGRESS_ENTRY_TYPES, PROGRESS_LOG_FIELDS
+
+    def _parse_eager_timestamps(log_filepath):
+        # NOTE: as before, i.e. all the timestamps converted while parsing
+        for entry in iter_log_entries(log_filepath):
+            entry.timestamp_ms
+
+    table = []
+    log_cache = LogCache(tempfile.mkdtemp())
+    for log_filepath in sorted(get_all_file_with_extension_in_dir_recursively(logs_dir, '.log')):
+        timestamps = [entry.timestamp for entry in iter_log_entries(log_filepath)]
+        log_cache.get(log_filepath) # NOTE: warm cache
+        table.append([
+            log_filepath,
+            len(timestamps),
+            _timeit(lambda: _parse_eager_timestamps(log_filepath), repeat=repeat),
+            _timeit(lambda: LogParser(log_filepath), repeat=repeat),
+            # NOTE: as when reconstructing the progress, i.e. all the notebooks but only the entries and fields it needs
+            _timeit(lambda: LogParser(log_filepath, entry_types=PROGRESS_ENTRY_TYPES, fields=PROGRESS_LOG_FIELDS), repeat=repeat),
+            _timeit(lambda: ColumnarLogStore.from_file(log_filepath), repeat=repeat),
+            _timeit(lambda: LogParser(log_filepath, cache=log_cache), repeat=repeat),
+            _timeit(lambda: [_convert_to_ms(timestamp) for timestamp in timestamps], repeat=repeat),
+            _timeit(lambda: convert_to_ms_bulk(timestamps), repeat=repeat),
+        ])
+    return tabulate(
+        table,
+        headers=['log', '# entries', 'parse, eager timestamps (ms)', 'parse, lazy timestamps (ms)', 'parse, pushdown (ms)', 'columnar parse (ms)', 'cached parse (ms)', 'timestamps per entry (ms)', 'timestamps bulk (ms)'],
+        floatfmt='.2f'
+    )
+
+
+def benchmark_memory(notebooks_dir, logs_dir, **kwargs) -> str:
+    import tracemalloc
+    from legacy.legacy_log_parser import parse_log_entries as legacy_parse_log_entries
+
+    def _traced_bytes(fn):
+        tracemalloc.start()
+        obj = fn()
+        traced_bytes, peak_traced_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return obj, traced_bytes, peak_traced_bytes
+
+    table = []
+    for log_filepath in sorted(get_all_file_with_extension_in_dir_recursively(logs_dir, '.log')):
+        # NOTE: baseline, i.e. the previous dict-backed entries with fields not interned
+        entries, traced_bytes, peak_traced_bytes = _traced_bytes(lambda: legacy_parse_log_entries(log_filepath))
+        table.append([log_filepath, 'LogEntry (legacy)', len(entries), traced_bytes / 1024**2, peak_traced_bytes / 1024**2, traced_bytes / max(len(entries), 1)])
+        del entries
+        log_parser, traced_bytes, peak_traced_bytes = _traced_bytes(lambda: LogParser(log_filepath))
+        table.append([log_filepath, 'LogEntry', len(log_parser), traced_bytes / 1024**2, peak_traced_bytes / 1024**2, traced_bytes / max(len(log_parser), 1)])
+        # NOTE: memory-mapped, only the line offsets are held
+        def _map_log():
+            log_parser = LogParser(log_filepath, mapped=True)
+            len(log_parser) # NOTE: the log is mapped (and its lines indexed) on first access
+            return log_parser
+
+        log_parser, traced_bytes, peak_traced_bytes = _traced_bytes(_map_log)
+        num_entries = len(log_parser)
+        table.append([log_filepath, 'LogEntry (memory-mapped)', num_entries, traced_bytes / 1024**2, peak_traced_bytes / 1024**2, traced_bytes / max(num_entries, 1)])
+        # NOTE: streamed, nothing is held once consumed
+        num_entries, traced_bytes, peak_traced_bytes = _traced_bytes(lambda: sum(1 for _ in iter_log_entries(log_filepath)))
+        table.append([log_filepath, 'LogEntry (streamed)', num_entries, traced_bytes / 1024**2, peak_traced_bytes / 1024**2, traced_bytes / max(num_entries, 1)])
+    for nb_filepath in sorted(get_all_file_with_extension_in_dir_recursively(notebooks_dir, '.ipynb')):
+        REFORMAT_CACHE.clear()
+        nb_parser, traced_bytes, peak_traced_bytes = _traced_bytes(lambda: [cell.source for cell in NotebookParser(nb_filepath)])
+        table.append([nb_filepath, 'CellEntry', len(nb_parser), traced_bytes / 1024**2, peak_traced_bytes / 1024**2, traced_bytes / max(len(nb_parser), 1)])
+    return tabulate(
+        table,
+        headers=['filepath', 'entries', '# entries', 'memory (MB)', 'peak memory (MB)', 'bytes per entry'],
+        floatfmt='.2f'
+    )
+
+
+BENCHMARKS = {
+    'nb_parse': benchmark_nb_parse,
+    'reformat': benchmark_reformat,
+    'diff': benchmark_diff,
+    'log_parse': benchmark_log_parse,
+    'memory': benchmark_memory,
+}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--notebooks_dir', type=str, default='data/tac_notebooks')
+    parser.add_argument('--logs_dir', type=str, default='data/tac_raw_logs')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--benchmarks', nargs='+',
+        default=list(BENCHMARKS.keys()),
+        choices=list(BENCHMARKS.keys())
+    )
+    args = parser.parse_args()
+
+    for benchmark_name in args.benchmarks:
+        report = BENCHMARKS[benchmark_name](
+            notebooks_dir=args.notebooks_dir,
+            logs_dir=args.logs_dir,
+            repeat=args.repeat
+        )
+        logger.info(f'Benchmark {benchmark_name}:\n{report}')
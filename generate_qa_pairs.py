@@ -1,10 +1,10 @@
 import os
 from typing import List
 from tqdm import tqdm
-from parsers.nb_parser import NotebookParser
+from parsers.nb_parser import NotebookParser, RENDER_CACHE, configure_reformat_cache
 from parsers.log_parser import LogParser
 from joblib import Parallel, delayed
-from copy import deepcopy
+from nb_timeline import NotebookTimeline
 from utils import (
     NotebookSession,
     get_selected_logged_sessions,
@@ -14,7 +14,7 @@ from utils import (
 
 
 def _generate_qa_pairs(
-    nb_states: List[NotebookParser],
+    nb_states: NotebookTimeline,
     t1: int, t2: int, method: str,
     consecutive_only: bool=True, # TODO, right now, consecutive_only is the only supported option
     num_questions: int=3
@@ -26,7 +26,7 @@ def _generate_qa_pairs(
     nb_state_t2 = nb_states[t2]
 
     qa_pairs_dict = {}
-    nb_diffs = nb_state_t1.get_diff(nb_state_t2)
+    nb_diffs = nb_states.diff(t1, t2)
     if consecutive_only:
         if len(nb_diffs) != 1:
             breakpoint()
@@ -37,6 +37,8 @@ def _generate_qa_pairs(
 
     cell_before_modification = nb_diffs[0][0]
     cell_after_modification = nb_diffs[0][1]
+    nb_updates = [cell_after_modification]
+    edit_script = nb_states.get_edit_script(t1)
     # code_before_modification = '\n'.join(cell_before_modification.source)
     code_after_modification = '\n'.join(cell_after_modification.source)
     code_out =\
@@ -50,11 +52,13 @@ def _generate_qa_pairs(
             nb_state_t1,
             nb_state_t2,
             max_num_questions_per_update=num_questions,
+            nb_updates=nb_updates,
         )
         answers, t1_contexts, t2_contexts = answer_questions(
             nb_state_t1,
             nb_state_t2,
             questions,
+            nb_updates=nb_updates,
         )
         question_answers = [
             {
@@ -102,6 +106,7 @@ def _generate_qa_pairs(
             nb_state_t1,
             nb_state_t2,
             questions,
+            nb_updates=nb_updates,
         )
         question_answers = [
             {
@@ -121,10 +126,11 @@ def _generate_qa_pairs(
     else:
         raise ValueError(f'Invalid method: {method}')
 
+    qa_pairs_dict[(t1, t2)]['edit_script'] = edit_script
     return qa_pairs_dict
 
 def get_qa_pairs(
-    nb_states: List[NotebookParser],
+    nb_states: NotebookTimeline,
     consecutive_only=True, method='offline',
     num_questions=3, pbar=True, n_jobs=-1
 ):
@@ -182,6 +188,22 @@ if __name__ == "__main__":
         choices=['offline', 'online', 'mix']
     )
     parser.add_argument('--shuffle_methods', action='store_true', default=False)
+    parser.add_argument('--reformat_cache_filepath', type=str, default=None,
+                        help='On-disk store for reformatted cells sources, reused across runs')
+    parser.add_argument('--reformat_cache_size', type=int, default=None,
+                        help='Maximum number of reformatted cells sources kept in memory')
+    parser.add_argument('--snapshot_dir', type=str, default=None,
+                        help='Directory of the reconstructed sessions snapshots, reused while their inputs and code are unchanged')
+    parser.add_argument('--log_cache_dir', type=str, default=None,
+                        help='Directory of the parsed logs (binary columnar files, requires numpy), reused while the logs are unchanged')
+    parser.add_argument('--rebuild_log_cache', action='store_true', default=False,
+                        help='Parse the logs again and overwrite their cached versions')
+    parser.add_argument('--log_db', type=str, default=None,
+                        help='SQLite database the logs are read from (see ingest_logs.py), instead of --log_cache_dir')
+    parser.add_argument('--write_all_states', action='store_true', default=False,
+                        help='Write every notebook state of each session along the first and last ones')
+    parser.add_argument('--archive_states', action='store_true', default=False,
+                        help='Pack the notebook states written by --write_all_states into a single zip per session')
     args = parser.parse_args()
 
     if not os.path.exists(args.logs_dir) and not args.simulate_log:
@@ -198,24 +220,36 @@ if __name__ == "__main__":
 
     os.makedirs(args.output_dir, exist_ok=True)
 
+    reformat_cache = configure_reformat_cache(
+        maxsize=args.reformat_cache_size,
+        cache_filepath=args.reformat_cache_filepath
+    )
 
     if args.simulate_log:
         selected_sessions: List[NotebookSession] = get_selected_simulated_sessions(
             args.notebooks_dir, min_num_steps=args.min_num_steps, offset=args.offset,
+            snapshot_dir=args.snapshot_dir
         )
     else:
         selected_sessions: List[NotebookSession] = get_selected_logged_sessions(
             args.notebooks_dir, args.logs_dir,
-            min_num_steps=args.min_num_steps, offset=args.offset
+            min_num_steps=args.min_num_steps, offset=args.offset,
+            snapshot_dir=args.snapshot_dir,
+            log_cache_dir=args.log_cache_dir,
+            rebuild_log_cache=args.rebuild_log_cache,
+            log_db=args.log_db
         )
 
+    logger.info(f'Reformat cache: {reformat_cache.info()}')
+    logger.info(f'Render cache: {RENDER_CACHE.info()}')
+
     for nb_session in selected_sessions:
         nb_session.info()
         qa_pairs_from_methods = [
             (
                 method,
                 get_qa_pairs(
-                    deepcopy(nb_session.nb_states),
+                    nb_session.nb_states,
                     consecutive_only=True,
                     method=method,
                     num_questions=args.num_questions,
@@ -239,7 +273,9 @@ if __name__ == "__main__":
         worksheet.write('A1', 'step_num')
         worksheet.set_column('B:B', width)
         worksheet.write('B1', 'modified_code')
-        col_offset_start = 2
+        worksheet.set_column('C:C', width)
+        worksheet.write('C1', 'change')
+        col_offset_start = 3
         col_offset = col_offset_start
         for method, qa_pairs in qa_pairs_from_methods:
             qa_pairs_method_name = f'{method}_qa_pairs'
@@ -267,6 +303,7 @@ if __name__ == "__main__":
                 qa_pair = qa_pairs[(t1, t2)]
                 worksheet.write(row, 0, step_num) # NOTE: rewritten for each method; should be same
                 worksheet.write(row, 1, qa_pair['code'], wrap_format) # NOTE: rewritten for each method; should be same
+                worksheet.write(row, 2, str(qa_pair['edit_script']), wrap_format) # NOTE: rewritten for each method; should be same
                 for row_offset, qa in enumerate(qa_pair['question_answers']):
                     for i, (k, v) in enumerate(qa.items()):
                         worksheet.write(row + row_offset, i + col_offset, v, wrap_format)
@@ -289,4 +326,6 @@ if __name__ == "__main__":
         #         txt_file.write(f'Column {i+2}: question_{qa_pairs_method_name}\n')
         #         txt_file.write(f'Column {i+3}: answer_{qa_pairs_method_name}\n')
 
-        nb_session.write_first_last_states(args.output_dir)
+        nb_session.write_first_last_states(
+            args.output_dir, all_states=args.write_all_states, archive=args.archive_states
+        )
@@ -0,0 +1,20 @@
+from loguru import logger
+from parsers.log_sqlite import ingest_logs
+from utils import get_all_file_with_extension_in_dir_recursively
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logs_dir', type=str, default='data/tac_raw_logs')
+    parser.add_argument('--db', type=str, default='__logs.sqlite')
+    parser.add_argument('--rebuild', action='store_true', default=False,
+                        help='Ingest all the logs again, even the ones unchanged since last ingested')
+    args = parser.parse_args()
+
+    log_filepaths = sorted(get_all_file_with_extension_in_dir_recursively(args.logs_dir, '.log'))
+    ingested_log_filepaths = ingest_logs(args.db, log_filepaths, rebuild=args.rebuild)
+    logger.success(
+        f'Ingested {len(ingested_log_filepaths)} new or changed log files into {args.db}, '
+        f'{len(log_filepaths) - len(ingested_log_filepaths)} unchanged'
+    )
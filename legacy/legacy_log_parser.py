@@ -0,0 +1,55 @@
+from datetime import datetime
+
+# NOTE: previous implementation of `parsers.log_parser.LogEntry` and of its parsing, i.e. one `__dict__` per entry,
+# fields not interned and timestamps converted eagerly; kept as the baseline of `benchmark.py` (memory benchmark)
+class LogEntry:
+    def __init__(self, _id, entry_type, subject, user, context, notebook, session_type, timestamp, content=None, cell_type=None):
+        self.id = _id
+        self.entry_type = entry_type
+        self.subject = subject
+        self.user = user
+        self.context = context
+        self.notebook = notebook
+        self.session_type = session_type
+        self.timestamp = timestamp
+        self.timestamp_ms = self.convert_to_ms(timestamp)
+        self.content = content
+        self.cell_type = cell_type
+
+    def set_content(self, content, cell_type):
+        self.content = content
+        self.cell_type = cell_type
+
+    def convert_to_ms(self, timestamp):
+        # Assuming that timestamps are in the format 'YYYY-MM-DDTHH:MM:SS.xxxxxx'
+        try:
+            timestamp_datetime = datetime.fromisoformat(timestamp)
+            timestamp_ms = int(timestamp_datetime.timestamp() * 1000)
+            return timestamp_ms
+        except TypeError:
+            return timestamp
+        except ValueError:
+            return timestamp
+
+
+def parse_log_entries(filepath):
+    entries = []
+    with open(filepath, 'r') as file:
+        for entry_id, line in enumerate(file):
+            parts = line.strip().split(":::")
+            if len(parts) >= 7:
+                entry_type = parts[0]
+                subject = parts[1]
+                user = parts[2]
+                context = parts[3]
+                notebook = parts[4]
+                session_type = parts[5]
+                timestamp = parts[6]
+                entry = LogEntry(entry_id, entry_type, subject, user, context, notebook, session_type, timestamp)
+                content = parts[7] if len(parts) >= 8 else None
+                cell_type = parts[8] if len(parts) >= 9 else None
+                entry.set_content(content, cell_type)
+                entries.append(entry)
+            else:
+                raise Exception(f"Invalid log entry: {line}")
+    return entries
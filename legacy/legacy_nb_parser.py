@@ -0,0 +1,91 @@
+# NOTE: previous implementation of `parsers.nb_parser._reformat_code_lines_uncached`,
+# kept as reference for `benchmark.py` (comments are put back by matching their preceding line)
+def reformat_code_lines(_source):
+    if len(_source) == 0:
+        return []
+    source = [
+        line
+        # line.rstrip() # remove trailing whitespace
+        for line in _source
+        if line.strip() # keep only non-empty lines
+    ]
+    comment_lines = []
+    comment_following_lines = []
+    for i, line in enumerate(source):
+        if line.startswith('#'):
+            prev_line = None if i == 0 else source[i-1]
+            comment_lines.append(line)
+            comment_following_lines.append(prev_line)
+
+    code = '\n'.join(list(map(str.rstrip, _source)))
+
+    def _parse_code(code):
+        # import black
+        # mode=black.Mode()
+        # longest_line_in_code = max([len(line)*2 for line in code.split('\n')])
+        # mode.line_length = longest_line_in_code
+        # formatted_code = black.format_str(code, mode=mode)
+        # return formatted_code
+
+        # Parse the code into an Abstract Syntax Tree (AST)
+        import ast
+        import astunparse
+        tree = ast.parse(code, type_comments=True)
+
+        # Unparse the AST back into code
+        formatted_code = astunparse.unparse(tree)
+
+        code = formatted_code.strip()
+        return code
+
+
+    new_source = _parse_code(code).split('\n')
+
+    # drop comments that were kept by the parser from the leftover comments
+    kept_comments = []
+    kept_following_lines = []
+    for comment, following_line in zip(comment_lines, comment_following_lines):
+        if comment.strip() not in new_source:
+            kept_comments.append(comment)
+            kept_following_lines.append(following_line)
+    comment_lines = kept_comments
+
+    new_source = [line.rstrip() for line in new_source if line.strip()]
+
+    _comment_following_lines = comment_following_lines
+    comment_following_lines = []
+    for line in _comment_following_lines:
+        if line:
+            line = line.strip()
+            try:
+                _line = _parse_code(line)
+                if _line:
+                    line = _line
+            except Exception:
+                pass
+
+        comment_following_lines.append(line)
+    del _comment_following_lines
+
+    # verification step
+    for line in comment_following_lines:
+        if line == '':
+            raise ValueError('Comment following line is empty and not None!')
+
+
+    # add back the comments
+    for comment, following_line in zip(comment_lines, comment_following_lines):
+        if following_line:
+            # new_source.insert(code_lines.index(following_line) + 1, comment)
+            for i, line in enumerate(new_source):
+                if line.rstrip().endswith(following_line.strip()):
+                    new_source.insert(i + 1, comment)
+                    break
+            else:
+                breakpoint()
+                raise ValueError(f'Could not find the following line: {following_line}')
+        else:
+            new_source.insert(0, comment)
+
+    new_source = [line.rstrip() for line in new_source if line.strip()]
+    return new_source
@@ -0,0 +1,195 @@
+from typing import List, Tuple, Sequence
+
+# (tag, i1, i2, j1, j2) as in `difflib.SequenceMatcher.get_opcodes`, i.e. a[i1:i2] -> b[j1:j2]
+Opcode = Tuple[str, int, int, int, int]
+
+
+def _myers_moves(a: Sequence, b: Sequence, max_cost: int):
+    """
+    Greedy forward Myers O((N+M)D) shortest edit path from a to b.
+    Returns the single line moves ('equal', 'insert' or 'delete') from the end backwards,
+    or None if more than `max_cost` edits are needed.
+    """
+    n, m = len(a), len(b)
+    max_d = min(n + m, max_cost)
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    trace = []
+    for d in range(max_d + 1):
+        # NOTE: only the diagonals reachable at this depth are kept, i.e. O(D^2) memory
+        trace.append(v[offset - d - 1: offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]     # down: insertion of b[y-1]
+            else:
+                x = v[offset + k - 1] + 1 # right: deletion of a[x-1]
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _myers_backtrack(trace, n, m)
+    return None
+
+
+def _myers_backtrack(trace, n, m):
+    moves = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        # NOTE: trace[d] holds the diagonals -d-1..d+1
+        if k == -d or (k != d and v[k - 1 + d + 1] < v[k + 1 + d + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[prev_k + d + 1]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            moves.append('equal')
+            x, y = x - 1, y - 1
+        if d > 0:
+            moves.append('insert' if x == prev_x else 'delete')
+        x, y = prev_x, prev_y
+    return moves
+
+
+def diff_lines(a: Sequence[str], b: Sequence[str], max_cost=1000) -> List[Opcode]:
+    """
+    Line-level diff of a -> b, as a list of opcodes compatible with `difflib.SequenceMatcher.get_opcodes`.
+    Past `max_cost` edits, the differing middle (after the common prefix and suffix) is a single 'replace'.
+    """
+    n, m = len(a), len(b)
+    prefix = 0
+    while prefix < n and prefix < m and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < n - prefix and suffix < m - prefix and a[n - suffix - 1] == b[m - suffix - 1]:
+        suffix += 1
+
+    opcodes = []
+    _append_equal(opcodes, 0, 0, prefix)
+
+    a_mid, b_mid = a[prefix:n - suffix], b[prefix:m - suffix]
+    moves = None
+    if a_mid and b_mid:
+        # NOTE: lines are compared as ints
+        line_ids = {}
+        moves = _myers_moves(
+            [line_ids.setdefault(line, len(line_ids)) for line in a_mid],
+            [line_ids.setdefault(line, len(line_ids)) for line in b_mid],
+            max_cost
+        )
+    if moves is None:
+        if a_mid or b_mid:
+            opcodes.append(_make_opcode(prefix, n - suffix, prefix, m - suffix))
+    else:
+        # group the single line moves into runs, as difflib does
+        i = j = prefix
+        run_start = None
+        for move in reversed(moves):
+            if move == 'equal':
+                if run_start is not None:
+                    opcodes.append(_make_opcode(run_start[0], i, run_start[1], j))
+                    run_start = None
+                _append_equal(opcodes, i, j, 1)
+                i, j = i + 1, j + 1
+            else:
+                if run_start is None:
+                    run_start = (i, j)
+                if move == 'delete':
+                    i += 1
+                else:
+                    j += 1
+        if run_start is not None:
+            opcodes.append(_make_opcode(run_start[0], i, run_start[1], j))
+
+    _append_equal(opcodes, n - suffix, m - suffix, suffix)
+    return opcodes
+
+
+def _append_equal(opcodes, i, j, size):
+    if not size:
+        return
+    if opcodes and opcodes[-1][0] == 'equal':
+        _, i1, _, j1, _ = opcodes.pop()
+        opcodes.append(('equal', i1, i + size, j1, j + size))
+    else:
+        opcodes.append(('equal', i, i + size, j, j + size))
+
+
+def _make_opcode(i1, i2, j1, j2) -> Opcode:
+    if i1 < i2 and j1 < j2:
+        return ('replace', i1, i2, j1, j2)
+    if i1 < i2:
+        return ('delete', i1, i2, j1, j2)
+    return ('insert', i1, i2, j1, j2)
+
+
+class EditScript:
+    """
+    Compact line-level edit script of a cell source, i.e. the non-equal opcodes of `diff_lines`.
+    Computed once per change and reused (e.g. change classification, prompts, reports).
+    """
+    __slots__ = ('ops',)
+
+    def __init__(self, ops: Tuple[Opcode, ...]=()):
+        self.ops = tuple(ops)
+
+    @classmethod
+    def from_lines(cls, lines_before, lines_after, max_cost=1000) -> 'EditScript':
+        return cls(op for op in diff_lines(lines_before, lines_after, max_cost=max_cost) if op[0] != 'equal')
+
+    @property
+    def inserted(self) -> List[Tuple[int, int]]:
+        # line ranges of the new source
+        return [(j1, j2) for tag, _, _, j1, j2 in self.ops if tag == 'insert']
+
+    @property
+    def deleted(self) -> List[Tuple[int, int]]:
+        # line ranges of the old source
+        return [(i1, i2) for tag, i1, i2, _, _ in self.ops if tag == 'delete']
+
+    @property
+    def modified(self) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        # pairs of line ranges of the old and new sources
+        return [((i1, i2), (j1, j2)) for tag, i1, i2, j1, j2 in self.ops if tag == 'replace']
+
+    @property
+    def change_type(self) -> str:
+        tags = {op[0] for op in self.ops}
+        if not tags:
+            return 'NONE'
+        if tags == {'insert'}:
+            return 'INSERT'
+        if tags == {'delete'}:
+            return 'DELETE'
+        return 'UPDATE'
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __iter__(self):
+        return iter(self.ops)
+
+    def __eq__(self, other):
+        return isinstance(other, EditScript) and self.ops == other.ops
+
+    def __hash__(self):
+        return hash(self.ops)
+
+    def __str__(self):
+        # e.g. `UPDATE +[3:5] -[7:8] ~[1:2]->[1:3]`, with 0-based line ranges
+        ops_strs = []
+        for tag, i1, i2, j1, j2 in self.ops:
+            if tag == 'insert':
+                ops_strs.append(f'+[{j1}:{j2}]')
+            elif tag == 'delete':
+                ops_strs.append(f'-[{i1}:{i2}]')
+            else:
+                ops_strs.append(f'~[{i1}:{i2}]->[{j1}:{j2}]')
+        return ' '.join([self.change_type] + ops_strs)
+
+    def __repr__(self):
+        return f'EditScript({self})'
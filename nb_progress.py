@@ -1,14 +1,20 @@
 import textwrap
 from parsers.nb_parser import NotebookParser
 from parsers.log_parser import LogParser, LogEntry
+from nb_diff import EditScript
 from utils import logger
 
+# NOTE: the only log entries (and their fields) the progress is reconstructed from, see `get_notebook_progress_using_log`
+PROGRESS_ENTRY_TYPES = ('CELL_SELECTED', 'CELL_EXECUTION_BEGIN', 'CELL_EXECUTION_END')
+PROGRESS_LOG_FIELDS = ('entry_type', 'notebook', 'content', 'cell_type')
+
 class NBStep:
     def __init__(self,
                  nb_parser_state: NotebookParser,
                  log_entry: LogEntry=None,
                  cell_id: int=None,
-                 change_type: str=None):
+                 change_type: str=None,
+                 edit_script: EditScript=None):
         if not isinstance(nb_parser_state, NotebookParser):
             raise Exception(f'Invalid nb_parser_state type: {type(nb_parser_state)}')
 
@@ -17,6 +23,8 @@ class NBStep:
 
         self.entries = [] if log_entry is None else [log_entry]
         self.change_type = [] if change_type is None else [change_type]
+        # line-level edit script of the changed cell, computed once (see `nb_diff.EditScript`)
+        self.edit_script = [] if edit_script is None else [edit_script]
         self.cell_id = cell_id
         self.nb_parser_state = nb_parser_state
         self.idx = -1
@@ -36,6 +44,11 @@ class NBStep:
         # else:
         #     return 'UPDATE'
 
+    def get_edit_script(self, change_i) -> EditScript:
+        if change_i > 0:
+            raise NotImplementedError("not implemented for change_i > 0")
+        return self.edit_script[change_i] if self.edit_script else None
+
     def __len__(self):
         return len(self.entries)
 
@@ -78,18 +91,10 @@ class NBStep:
         if found_cell:
             if replacement_log_entry.content is not None:
                 new_state = self.nb_parser_state.replace_cell_content(found_cell, replacement_log_entry.content)
-                # add type of change
-                # if a line is added    :  INSERT
-                if len(found_cell.source) < len(replacement_log_entry.content.split('\\n')):
-                    change_type = 'INSERT'
-                # if a line is removed  :  DELETE
-                elif len(found_cell.source) > len(replacement_log_entry.content.split('\\n')):
-                    change_type = 'DELETE'
-                # if both have the same number of lines: UPDATE
-                elif len(found_cell.source) == len(replacement_log_entry.content.split('\\n')):
-                    change_type = 'UPDATE'
-                else:
-                    raise Exception('Invalid change type')
+                # type of change from the line-level diff of the cell:
+                # only added lines: INSERT, only removed lines: DELETE, otherwise: UPDATE
+                edit_script = EditScript.from_lines(found_cell.source, new_state[found_cell.cell_id].source)
+                change_type = edit_script.change_type
             else:
                 # new_state = self.nb_parser_state.drop_code(found_cell)
                 raise NotImplementedError()
@@ -101,7 +106,8 @@ class NBStep:
                 nb_parser_state=new_state,
                 log_entry=replacement_log_entry,
                 cell_id=found_cell.cell_id,
-                change_type=change_type
+                change_type=change_type,
+                edit_script=edit_script
             )
             return next_step
         return None
@@ -269,7 +275,8 @@ def get_notebook_progress_simulate(nb_parser_t: NotebookParser, keep_code_header
                 nb_parser_state=nb_parser_t, # the new state at time t, before the reverse change
                 log_entry=fake_cell_excution_begin_entry,
                 cell_id=current_cell.cell_id,
-                change_type='INSERT'
+                change_type='INSERT',
+                edit_script=EditScript.from_lines(nb_diffs[0][0].source, nb_diffs[0][1].source)
             )
         )
 
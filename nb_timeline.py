@@ -0,0 +1,185 @@
+import os
+from collections import OrderedDict
+from typing import List, Tuple
+from parsers.nb_parser import NotebookParser, CellEntry, _write_atomically
+from nb_diff import EditScript
+
+
+class NotebookTimeline:
+    """
+    Delta-encoded sequence of notebook states: the base (first) state plus, per step,
+    the compact patch of cells replaced to get from state t to state t+1.
+    States are materialized on demand and a small LRU of recently used ones is kept.
+    """
+    def __init__(self, base_state: NotebookParser=None, max_cached_states=8):
+        self.max_cached_states = max_cached_states
+        self.base_state = None
+        self._last_state = None
+        # patches[t] is a tuple of (cell_idx, cell_before, cell_after) from state t to state t+1
+        self.patches: List[Tuple[Tuple[int, CellEntry, CellEntry], ...]] = []
+        # edit_scripts[t] is the line-level edit script of the cell changed from state t to state t+1, if known
+        self.edit_scripts: List[EditScript] = []
+        self._cache = OrderedDict()
+        if base_state is not None:
+            self.append(base_state)
+
+    def append(self, nb_state: NotebookParser, edit_script: EditScript=None) -> 'NotebookTimeline':
+        if not isinstance(nb_state, NotebookParser):
+            raise Exception(f'Invalid nb_state type: {type(nb_state)}')
+
+        if self.base_state is None:
+            self.base_state = nb_state
+        else:
+            if len(nb_state) != len(self._last_state):
+                raise ValueError('Invalid number of cells in the notebook states')
+            # NOTE: states are copy-on-write, hence untouched cells are the very same objects
+            patch = tuple(
+                (cell_idx, cell_before, cell_after)
+                for cell_idx, (cell_before, cell_after)
+                in enumerate(zip(self._last_state.cell_entries, nb_state.cell_entries))
+                if cell_before is not cell_after
+            )
+            self.patches.append(patch)
+            self.edit_scripts.append(edit_script)
+        self._last_state = nb_state
+        self._remember(len(self) - 1, nb_state)
+        return self
+
+    def __len__(self):
+        if self.base_state is None:
+            return 0
+        return len(self.patches) + 1
+
+    def _normalize_idx(self, t):
+        if t < 0:
+            t += len(self)
+        if not 0 <= t < len(self):
+            raise IndexError(f'Notebook state index out of range: {t}')
+        return t
+
+    def _remember(self, t, nb_state):
+        self._cache[t] = nb_state
+        self._cache.move_to_end(t)
+        while len(self._cache) > self.max_cached_states:
+            self._cache.popitem(last=False)
+
+    def _materialize(self, t) -> NotebookParser:
+        if t in self._cache:
+            self._cache.move_to_end(t)
+            return self._cache[t]
+
+        # start from the closest cached state before t, otherwise from the base state
+        start_t = max((cached_t for cached_t in self._cache if cached_t < t), default=0)
+        nb_state = self._cache.get(start_t, self.base_state)
+        if start_t < t:
+            nb_state = nb_state.replace_cells(
+                (cell_idx, cell_after)
+                for patch in self.patches[start_t:t]
+                for cell_idx, _, cell_after in patch
+            )
+        self._remember(t, nb_state)
+        return nb_state
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError('Only contiguous slices of notebook states are supported')
+            sub_timeline = NotebookTimeline(max_cached_states=self.max_cached_states)
+            if start < stop:
+                sub_timeline.base_state = self[start]
+                sub_timeline.patches = self.patches[start:stop-1]
+                sub_timeline.edit_scripts = self.edit_scripts[start:stop-1]
+                sub_timeline._last_state = self[stop-1]
+                sub_timeline._remember(0, sub_timeline.base_state)
+            return sub_timeline
+        return self._materialize(self._normalize_idx(key))
+
+    def __iter__(self):
+        if self.base_state is None:
+            return
+        nb_state = self.base_state
+        yield nb_state
+        for patch in self.patches:
+            nb_state = nb_state.replace_cells(
+                (cell_idx, cell_after) for cell_idx, _, cell_after in patch
+            )
+            yield nb_state
+
+    def diff(self, t1, t2) -> List[Tuple[CellEntry, CellEntry]]:
+        t1, t2 = self._normalize_idx(t1), self._normalize_idx(t2)
+        if t2 == t1 + 1:
+            # straight from the stored patch, keeping `NotebookParser.get_diff` semantics
+            return [
+                (cell_before, cell_after)
+                for _, cell_before, cell_after in self.patches[t1]
+                if cell_before != cell_after
+            ]
+        return self[t1].get_diff(self[t2])
+
+    def get_edit_script(self, t) -> EditScript:
+        # line-level edit script from state t to state t+1, diffed (once) if not given on `append`
+        t = self._normalize_idx(t)
+        if t + 1 >= len(self):
+            raise IndexError(f'No notebook state after state {t}')
+        if self.edit_scripts[t] is None:
+            diffs = self.diff(t, t + 1)
+            if len(diffs) != 1:
+                raise ValueError(f'Edit scripts are only defined for single cell changes, got {len(diffs)} changed cells')
+            self.edit_scripts[t] = EditScript.from_lines(diffs[0][0].source, diffs[0][1].source)
+        return self.edit_scripts[t]
+
+    def get_updates(self, t1, t2) -> List[CellEntry]:
+        return [diff[1] for diff in self.diff(t1, t2)]
+
+    def write_notebooks(self, directory, steps=None, filepath_postfix='_state', indent=None, archive_filepath=None) -> List[str]:
+        """
+        Writes the notebook states (all of them, unless `steps` are given) in a single pass over the timeline.
+        Cells shared between states are serialized once. If `archive_filepath` is given, the states are packed
+        into a single zip archive instead of separate files.
+        Returns the written filepaths (the archive members names, if archived).
+        """
+        import zipfile
+        steps = set(range(len(self))) if steps is None else {self._normalize_idx(t) for t in steps}
+        num_digits = len(str(max(len(self) - 1, 0)))
+        rendered_cells = {}
+        filepaths = []
+        archive = None
+        if archive_filepath is not None:
+            tmp_archive_filepath = f'{archive_filepath}.tmp{os.getpid()}'
+            if os.path.dirname(archive_filepath):
+                os.makedirs(os.path.dirname(archive_filepath), exist_ok=True)
+            archive = zipfile.ZipFile(tmp_archive_filepath, 'w', compression=zipfile.ZIP_DEFLATED)
+        try:
+            for t, nb_state in enumerate(self):
+                if t not in steps:
+                    continue
+                filepath = nb_state.get_notebook_filepath(
+                    directory=directory, filepath_postfix=f'{filepath_postfix}_{t:0{num_digits}d}'
+                )
+                nb_str = nb_state.to_notebook_str(indent=indent, rendered_cells=rendered_cells)
+                if archive is not None:
+                    filepath = os.path.relpath(filepath, directory)
+                    archive.writestr(filepath, nb_str)
+                else:
+                    _write_atomically(filepath, nb_str)
+                filepaths.append(filepath)
+        except BaseException:
+            # NOTE: no partially written archive is left behind
+            if archive is not None:
+                archive.close()
+                os.remove(tmp_archive_filepath)
+            raise
+        if archive is not None:
+            archive.close()
+            os.replace(tmp_archive_filepath, archive_filepath)
+        return filepaths
+
+    def __getstate__(self):
+        # NOTE: materialized states are not shipped along (e.g. to joblib workers)
+        state = self.__dict__.copy()
+        state['_cache'] = OrderedDict()
+        return state
+
+    def __repr__(self):
+        return f'NotebookTimeline(num_states={len(self)}, num_changed_cells={sum(map(len, self.patches))})'
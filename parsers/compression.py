@@ -0,0 +1,51 @@
+import io
+
+# NOTE: suffixes of the compressed variants of the logs and notebooks, e.g. `knic-tac-evaluation.log.gz`
+COMPRESSION_SUFFIXES = ('.gz', '.xz', '.bz2', '.zst')
+
+
+def get_compression_suffix(filepath) -> str:
+    # compression suffix of the file, None if not compressed
+    for suffix in COMPRESSION_SUFFIXES:
+        if filepath.endswith(suffix):
+            return suffix
+    return None
+
+
+def strip_compression_suffix(filepath) -> str:
+    # e.g. `A-subject-1.ipynb.zst` -> `A-subject-1.ipynb`
+    suffix = get_compression_suffix(filepath)
+    return filepath[:-len(suffix)] if suffix else filepath
+
+
+def is_compressed(filepath) -> bool:
+    return get_compression_suffix(filepath) is not None
+
+
+def open_file(filepath, mode='r'):
+    """
+    Opens the file for reading ('r' or 'rb'), stream-decompressing it on the fly if compressed
+    (see `COMPRESSION_SUFFIXES`; `.zst` requires zstandard).
+    """
+    suffix = get_compression_suffix(filepath)
+    if suffix is None:
+        return open(filepath, mode)
+    text_mode = 'b' not in mode
+    if suffix == '.gz':
+        import gzip
+        file = gzip.open(filepath, 'rb')
+    elif suffix == '.xz':
+        import lzma
+        file = lzma.open(filepath, 'rb')
+    elif suffix == '.bz2':
+        import bz2
+        file = bz2.open(filepath, 'rb')
+    else:
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f'zstandard is required to read {filepath}, install it with `pip install zstandard`')
+        file = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(filepath, 'rb'), closefd=True))
+    # NOTE: decompressed streams are buffered, decoded as plain files would be
+    return io.TextIOWrapper(file) if text_mode else file
+
@@ -0,0 +1,415 @@
+import os
+import json
+import numpy as np
+from typing import List, Tuple
+from parsers.log_parser import LogEntry, _split_log_line, _convert_to_ms, _intern
+from parsers.compression import open_file
+
+# NOTE: bump whenever the columns layout (or how they are parsed) changes, so that cached logs are rebuilt
+LOG_CACHE_VERSION = 1
+
+# NOTE: timestamp_ms of the entries whose timestamp could not be converted
+MISSING_TIMESTAMP_MS = np.iinfo(np.int64).min
+
+
+# 'YYYY-MM-DDTHH:MM:SS.xxxxxx' separators positions, all the other characters are digits
+_ISO_TIMESTAMP_LENGTH = 26
+_ISO_TIMESTAMP_SEPARATORS = {4: '-', 7: '-', 10: 'T', 13: ':', 16: ':', 19: '.'}
+
+
+def _parse_iso_timestamps_bulk(timestamps):
+    """
+    Parses naive ISO timestamps ('YYYY-MM-DDTHH:MM:SS.xxxxxx') as fixed-width byte columns.
+    Returns the (naive, i.e. as if UTC) epoch seconds, the microseconds and the mask of the parsed ones;
+    timestamps in any other format, or invalid dates, are not parsed.
+    """
+    # NOTE: one extra byte to tell apart longer strings, shorter ones are NUL padded (i.e. not digits)
+    chars = np.array(timestamps, dtype=f'S{_ISO_TIMESTAMP_LENGTH + 1}').view(np.uint8).reshape(len(timestamps), -1)
+    is_parsed = chars[:, _ISO_TIMESTAMP_LENGTH] == 0
+    for pos, separator in _ISO_TIMESTAMP_SEPARATORS.items():
+        is_parsed &= chars[:, pos] == ord(separator)
+    # NOTE: uint8 wraps around, i.e. characters before '0' are > 9 as well
+    digits = chars[:, :_ISO_TIMESTAMP_LENGTH] - np.uint8(ord('0'))
+    digits_pos = [pos for pos in range(_ISO_TIMESTAMP_LENGTH) if pos not in _ISO_TIMESTAMP_SEPARATORS]
+    is_parsed &= (digits[:, digits_pos] <= 9).all(axis=1)
+
+    def _number(start, end):
+        number = digits[:, start].astype(np.int64)
+        for pos in range(start + 1, end):
+            number = number * 10 + digits[:, pos]
+        return np.where(is_parsed, number, 0)
+
+    year, month, day = _number(0, 4), _number(5, 7), _number(8, 10)
+    hour, minute, second, microsecond = _number(11, 13), _number(14, 16), _number(17, 19), _number(20, 26)
+    is_parsed &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+
+    months = np.where(is_parsed, (year - 1970) * 12 + month - 1, 0)
+    month_start_days = months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    next_month_start_days = (months + 1).astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    is_parsed &= day <= next_month_start_days - month_start_days
+
+    naive_s = (month_start_days + day - 1) * 86400 + hour * 3600 + minute * 60 + second
+    return naive_s, microsecond, is_parsed
+
+
+def convert_to_ms_bulk(timestamps) -> np.ndarray:
+    """
+    Vectorized `LogEntry.convert_to_ms` of a whole column of naive ISO timestamps ('YYYY-MM-DDTHH:MM:SS.xxxxxx'),
+    giving the very same (local time) epoch milliseconds. Timestamps in any other format fall back to the
+    per-entry conversion, those that cannot be converted at all are `MISSING_TIMESTAMP_MS`.
+    """
+    from datetime import datetime, timedelta
+    timestamp_ms = np.full(len(timestamps), MISSING_TIMESTAMP_MS, dtype=np.int64)
+    if not len(timestamps):
+        return timestamp_ms
+
+    try:
+        # NOTE: non strings (e.g. None) are not in the expected format either, hence converted per entry
+        naive_s, microseconds, is_bulk = _parse_iso_timestamps_bulk(timestamps)
+    except UnicodeEncodeError:
+        is_bulk = np.zeros(len(timestamps), dtype=bool)
+
+    if is_bulk.any():
+        naive_s, microseconds = naive_s[is_bulk], microseconds[is_bulk]
+        # local time -> epoch, with the UTC offset resolved (once) per hour
+        hours, hours_idxs = np.unique(naive_s // 3600, return_inverse=True)
+        hours_offsets = np.array([
+            hour * 3600 - int((datetime(1970, 1, 1) + timedelta(hours=hour)).timestamp())
+            for hour in hours.tolist()
+        ], dtype=np.int64)
+        epoch_s = naive_s - hours_offsets[hours_idxs]
+        # NOTE: same float arithmetic as `int(datetime.timestamp() * 1000)`
+        timestamp_ms[is_bulk] = np.trunc((epoch_s.astype(np.float64) + microseconds / 1e6) * 1000).astype(np.int64)
+
+    for idx in np.flatnonzero(~is_bulk):
+        value = _convert_to_ms(timestamps[idx])
+        if isinstance(value, int):
+            timestamp_ms[idx] = value
+    return timestamp_ms
+
+
+CATEGORICAL_FIELDS = ('entry_type', 'subject', 'user', 'context', 'notebook', 'session_type', 'cell_type')
+
+
+class _CategoricalColumn:
+    # int32 codes into a list of categories (e.g. entry types, notebooks, ..)
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+        self._category_codes = {category: code for code, category in enumerate(categories)}
+
+    @classmethod
+    def from_values(cls, values) -> '_CategoricalColumn':
+        category_codes = {}
+        codes = np.fromiter(
+            (category_codes.setdefault(value, len(category_codes)) for value in values),
+            dtype=np.int32, count=len(values)
+        )
+        return cls(codes, list(category_codes))
+
+    def take(self, idxs) -> '_CategoricalColumn':
+        # NOTE: categories are shared, only the codes are subset
+        column = self.__class__.__new__(self.__class__)
+        column.codes = self.codes[idxs]
+        column.categories = self.categories
+        column._category_codes = self._category_codes
+        return column
+
+    def isin(self, values) -> np.ndarray:
+        codes = [self._category_codes[value] for value in values if value in self._category_codes]
+        return np.isin(self.codes, codes)
+
+    def __getitem__(self, idx):
+        return self.categories[self.codes[idx]]
+
+
+class _StringColumn:
+    # utf-8 buffer of all the strings, each one being buffer[starts[i]:ends[i]] (None if starts[i] < 0)
+    def __init__(self, buffer, starts, ends):
+        self.buffer = buffer
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_values(cls, values) -> '_StringColumn':
+        encoded_values = [b'' if value is None else value.encode('utf-8') for value in values]
+        lengths = np.fromiter(map(len, encoded_values), dtype=np.int64, count=len(encoded_values))
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        starts[np.fromiter((value is None for value in values), dtype=bool, count=len(values))] = -1
+        return cls(b''.join(encoded_values), starts, ends)
+
+    def take(self, idxs) -> '_StringColumn':
+        # NOTE: the buffer is shared, only the offsets are subset
+        return self.__class__(self.buffer, self.starts[idxs], self.ends[idxs])
+
+    def to_list(self) -> List[str]:
+        buffer = self.buffer
+        return [
+            None if start < 0 else buffer[start:end].decode('utf-8')
+            for start, end in zip(self.starts.tolist(), self.ends.tolist())
+        ]
+
+    def __getitem__(self, idx):
+        start = self.starts[idx]
+        if start < 0:
+            return None
+        return self.buffer[start:self.ends[idx]].decode('utf-8')
+
+
+class ColumnarLogStore:
+    """
+    Array-backed log entries for analytics over large logs: entry ids and `timestamp_ms` as int64 arrays,
+    low-cardinality fields as categorical codes and `timestamp`/`content` as string-offset buffers.
+    Filters and time windows are vectorized and return stores sharing the buffers;
+    `LogEntry` objects are only created when indexed.
+    """
+    def __init__(self, ids, timestamp_ms, categoricals, timestamps, contents):
+        self.ids = ids
+        self.timestamp_ms = timestamp_ms
+        self.categoricals = categoricals
+        self.timestamps = timestamps
+        self.contents = contents
+
+    @classmethod
+    def from_rows(cls, rows) -> 'ColumnarLogStore':
+        # rows: (entry_id, [entry_type, subject, user, context, notebook, session_type, timestamp, content, cell_type])
+        ids, fields = [], []
+        for entry_id, parts in rows:
+            ids.append(entry_id)
+            fields.append(parts)
+        field_values = lambda field_idx: [parts[field_idx] if len(parts) > field_idx else None for parts in fields]
+        timestamps = field_values(6)
+        return cls(
+            ids=np.array(ids, dtype=np.int64),
+            timestamp_ms=convert_to_ms_bulk(timestamps),
+            categoricals={
+                field: _CategoricalColumn.from_values(field_values(field_idx))
+                for field, field_idx in zip(CATEGORICAL_FIELDS, (0, 1, 2, 3, 4, 5, 8))
+            },
+            timestamps=_StringColumn.from_values(timestamps),
+            contents=_StringColumn.from_values(field_values(7)),
+        )
+
+    @classmethod
+    def from_file(cls, filepath) -> 'ColumnarLogStore':
+        # NOTE: lines are split straight into columns, no `LogEntry` is created
+        with open_file(filepath, 'r') as file:
+            return cls.from_rows((entry_id, _split_log_line(line)) for entry_id, line in enumerate(file))
+
+    @classmethod
+    def from_entries(cls, entries) -> 'ColumnarLogStore':
+        return cls.from_rows(
+            (entry.id, [
+                entry.entry_type, entry.subject, entry.user, entry.context, entry.notebook,
+                entry.session_type, entry.timestamp, entry.content, entry.cell_type
+            ])
+            for entry in entries
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def take(self, idxs) -> 'ColumnarLogStore':
+        # idxs: positions, slice or boolean mask of the entries to keep
+        return self.__class__(
+            ids=self.ids[idxs],
+            timestamp_ms=self.timestamp_ms[idxs],
+            categoricals={field: column.take(idxs) for field, column in self.categoricals.items()},
+            timestamps=self.timestamps.take(idxs),
+            contents=self.contents.take(idxs),
+        )
+
+    def get_entry(self, idx) -> LogEntry:
+        entry = LogEntry(
+            int(self.ids[idx]),
+            *(self.categoricals[field][idx] for field in CATEGORICAL_FIELDS[:6]),
+            self.timestamps[idx]
+        )
+        entry.set_content(self.contents[idx], self.categoricals['cell_type'][idx])
+        if self.timestamp_ms[idx] != MISSING_TIMESTAMP_MS:
+            entry.timestamp_ms = int(self.timestamp_ms[idx])
+        return entry
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            if idx < 0:
+                idx += len(self)
+            if not 0 <= idx < len(self):
+                raise IndexError(f'Log entry index out of range: {idx}')
+            return self.get_entry(idx)
+        return self.take(idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.get_entry(idx)
+
+    def to_entries(self) -> List[LogEntry]:
+        # NOTE: columns are converted to lists at once rather than indexed entry by entry, and entries are
+        # filled in directly, categories being already shared (i.e. interned) strings
+        categorical_values = [
+            [self.categoricals[field].categories[code] for code in self.categoricals[field].codes.tolist()]
+            for field in CATEGORICAL_FIELDS
+        ]
+        new_entry = LogEntry.__new__
+        entries = []
+        for entry_id, timestamp_ms, timestamp, content, entry_type, subject, user, context, notebook, session_type, cell_type in zip(
+            self.ids.tolist(), self.timestamp_ms.tolist(), self.timestamps.to_list(), self.contents.to_list(),
+            *categorical_values
+        ):
+            entry = new_entry(LogEntry)
+            entry.id = entry_id
+            entry.entry_type = entry_type
+            entry.subject = subject
+            entry.user = user
+            entry.context = context
+            entry.notebook = notebook
+            entry.session_type = session_type
+            entry.timestamp = timestamp
+            entry._timestamp_ms = None if timestamp_ms == MISSING_TIMESTAMP_MS else timestamp_ms
+            entry.content = content
+            entry.cell_type = cell_type
+            entries.append(entry)
+        return entries
+
+    def mask(self, **kwargs) -> np.ndarray:
+        # same semantics as `LogParser.get_only`, as a boolean mask over the entries
+        mask = np.ones(len(self), dtype=bool)
+        for key, value in kwargs.items():
+            if not isinstance(value, list):
+                value = [value]
+            if key in self.categoricals:
+                mask &= self.categoricals[key].isin([_intern(v) for v in value])
+            elif key == 'id':
+                mask &= np.isin(self.ids, value)
+            elif key == 'timestamp_ms':
+                mask &= np.isin(self.timestamp_ms, value)
+            else:
+                raise ValueError(f'Unsupported field for columnar filters: {key}')
+        return mask
+
+    def get_only(self, **kwargs) -> 'ColumnarLogStore':
+        return self.take(self.mask(**kwargs))
+
+    def get_filtered(self, **kwargs) -> 'ColumnarLogStore':
+        # NOTE: as `LogParser.get_filtered`, entries matching any of the conditions are dropped
+        mask = np.ones(len(self), dtype=bool)
+        for key, value in kwargs.items():
+            mask &= ~self.mask(**{key: value})
+        return self.take(mask)
+
+    def time_window(self, start_ms=None, end_ms=None) -> 'ColumnarLogStore':
+        # entries with start_ms <= timestamp_ms < end_ms (entries without a valid timestamp are dropped)
+        mask = self.timestamp_ms != MISSING_TIMESTAMP_MS
+        if start_ms is not None:
+            mask &= self.timestamp_ms >= start_ms
+        if end_ms is not None:
+            mask &= self.timestamp_ms < end_ms
+        return self.take(mask)
+
+    def value_counts(self, field) -> dict:
+        column = self.categoricals[field]
+        counts = np.bincount(column.codes, minlength=len(column.categories))
+        return {category: int(count) for category, count in zip(column.categories, counts) if count}
+
+    def get_unique(self, field) -> set:
+        return set(self.value_counts(field))
+
+    def save(self, filepath, key=None):
+        # binary columnar file (.npz), written atomically; key: json-serializable description of its source
+        arrays = {
+            'key': np.array(json.dumps(key)),
+            'ids': self.ids,
+            'timestamp_ms': self.timestamp_ms,
+            'categories': np.array(json.dumps({field: column.categories for field, column in self.categoricals.items()})),
+        }
+        for field, column in self.categoricals.items():
+            arrays[f'{field}_codes'] = column.codes
+        for name, column in (('timestamps', self.timestamps), ('contents', self.contents)):
+            arrays[f'{name}_buffer'] = np.frombuffer(column.buffer, dtype=np.uint8)
+            arrays[f'{name}_starts'] = column.starts
+            arrays[f'{name}_ends'] = column.ends
+        if os.path.dirname(filepath):
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        tmp_filepath = f'{filepath}.tmp{os.getpid()}'
+        try:
+            with open(tmp_filepath, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_filepath, filepath)
+        except BaseException:
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+            raise
+
+    @classmethod
+    def load(cls, filepath) -> Tuple['ColumnarLogStore', object]:
+        # returns the store and the key it was saved with
+        with np.load(filepath, allow_pickle=False) as arrays:
+            categories = json.loads(str(arrays['categories']))
+            store = cls(
+                ids=arrays['ids'],
+                timestamp_ms=arrays['timestamp_ms'],
+                categoricals={
+                    field: _CategoricalColumn(arrays[f'{field}_codes'], categories[field])
+                    for field in CATEGORICAL_FIELDS
+                },
+                timestamps=_StringColumn(arrays['timestamps_buffer'].tobytes(), arrays['timestamps_starts'], arrays['timestamps_ends']),
+                contents=_StringColumn(arrays['contents_buffer'].tobytes(), arrays['contents_starts'], arrays['contents_ends']),
+            )
+            return store, json.loads(str(arrays['key']))
+
+    def __repr__(self):
+        return f'ColumnarLogStore(num_entries={len(self)})'
+
+
+class LogCache:
+    """
+    On-disk cache of parsed logs as binary columnar files, keyed by the log path, size and mtime
+    (and its content hash if `verify_hash`). Raw logs never change once written, hence warm runs skip text parsing.
+    rebuild: cached logs are ignored (and overwritten) instead of loaded.
+    """
+    def __init__(self, cache_dir, verify_hash=False, rebuild=False):
+        self.cache_dir = cache_dir
+        self.verify_hash = verify_hash
+        self.rebuild = rebuild
+
+    def _get_cache_filepath(self, filepath) -> str:
+        import hashlib
+        path_hash = hashlib.blake2b(os.path.abspath(filepath).encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, f'{os.path.basename(filepath)}_{path_hash}.npz')
+
+    def make_key(self, filepath) -> dict:
+        stat = os.stat(filepath)
+        key = {
+            'version': LOG_CACHE_VERSION,
+            'filepath': os.path.abspath(filepath),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+        }
+        if self.verify_hash:
+            from snapshots import hash_file
+            key['hash'] = hash_file(filepath)
+        return key
+
+    def load(self, filepath) -> 'ColumnarLogStore':
+        # returns None if the log is not cached, or was cached for an older version of the log
+        cache_filepath = self._get_cache_filepath(filepath)
+        if self.rebuild or not os.path.exists(cache_filepath):
+            return None
+        try:
+            store, key = ColumnarLogStore.load(cache_filepath)
+        except Exception:
+            return None
+        if key != self.make_key(filepath):
+            return None
+        return store
+
+    def save(self, filepath, store):
+        store.save(self._get_cache_filepath(filepath), key=self.make_key(filepath))
+
+    def get(self, filepath) -> 'ColumnarLogStore':
+        store = self.load(filepath)
+        if store is None:
+            store = ColumnarLogStore.from_file(filepath)
+            self.save(filepath, store)
+        return store
@@ -0,0 +1,224 @@
+import os
+import mmap
+import struct
+from array import array
+from typing import List
+from parsers.log_parser import LogEntry, _parse_log_line
+from parsers.compression import open_file, is_compressed
+
+# NOTE: the line index is persisted next to the log, e.g. `knic-tac-evaluation.log.lineidx`
+LINE_INDEX_SUFFIX = '.lineidx'
+# NOTE: bump whenever the line index layout changes, so that persisted ones are rebuilt
+LINE_INDEX_VERSION = 1
+# magic, version, size and mtime_ns of the indexed log, number of offsets
+_LINE_INDEX_HEADER = struct.Struct('<8sIqqq')
+_LINE_INDEX_MAGIC = b'LOGLNIDX'
+
+
+def build_line_offsets(buffer, start=0) -> array:
+    """
+    Byte offsets of the lines of a log (e.g. memory-mapped), i.e. line i is buffer[offsets[i]:offsets[i+1]].
+    Lines are split on '\\n' only, a last line not terminated by it being a line as well.
+    start: offset of the first line to index (e.g. the first one appended since the log was last indexed)
+    """
+    offsets = array('q', [start])
+    size = len(buffer)
+    find = buffer.find
+    end = find(b'\n', start)
+    while end != -1:
+        offsets.append(end + 1)
+        end = find(b'\n', end + 1)
+    if offsets[-1] != size:
+        offsets.append(size)
+    return offsets
+
+
+def _load_line_offsets(index_filepath, stat) -> array:
+    # returns None if there is no line index, or if it was built for another version of the log
+    try:
+        with open(index_filepath, 'rb') as f:
+            header = f.read(_LINE_INDEX_HEADER.size)
+            magic, version, size, mtime_ns, num_offsets = _LINE_INDEX_HEADER.unpack(header)
+            if (magic, version, size, mtime_ns) != (_LINE_INDEX_MAGIC, LINE_INDEX_VERSION, stat.st_size, stat.st_mtime_ns):
+                return None
+            offsets = array('q')
+            offsets.fromfile(f, num_offsets)
+            return offsets
+    except (OSError, EOFError, struct.error):
+        return None
+
+
+def _save_line_offsets(index_filepath, stat, offsets):
+    tmp_filepath = f'{index_filepath}.tmp{os.getpid()}'
+    try:
+        with open(tmp_filepath, 'wb') as f:
+            f.write(_LINE_INDEX_HEADER.pack(_LINE_INDEX_MAGIC, LINE_INDEX_VERSION, stat.st_size, stat.st_mtime_ns, len(offsets)))
+            offsets.tofile(f)
+        os.replace(tmp_filepath, index_filepath)
+    except OSError:
+        # NOTE: e.g. read-only log directories, the index is then only kept in memory
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+
+
+class MappedLogStore:
+    """
+    Memory-mapped log file with random access to its entries by position, i.e. by entry id.
+    Only the line offsets (8 bytes per entry) are kept in memory, `LogEntry` objects are decoded when indexed.
+    The offsets are computed once and persisted next to the log, see `LINE_INDEX_SUFFIX`.
+    Compressed logs cannot be mapped, they are decompressed in memory instead.
+    """
+    def __init__(self, filepath, persist_index=True):
+        self.filepath = filepath
+        self.persist_index = persist_index
+        self._mapped = None
+        self._offsets = None
+        self._file_id = None
+
+    def _open(self):
+        # NOTE: lazily (re)opened, e.g. once unpickled
+        if self._offsets is not None:
+            return
+        with open(self.filepath, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            if is_compressed(self.filepath):
+                with open_file(self.filepath, 'rb') as decompressed_file:
+                    mapped = decompressed_file.read()
+            elif stat.st_size:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # NOTE: empty files cannot be mapped
+                mapped = b''
+        index_filepath = self.filepath + LINE_INDEX_SUFFIX
+        offsets = _load_line_offsets(index_filepath, stat) if self.persist_index else None
+        if offsets is None:
+            offsets = build_line_offsets(mapped)
+            if self.persist_index:
+                _save_line_offsets(index_filepath, stat, offsets)
+        self._mapped = mapped
+        self._offsets = offsets
+        self._file_id = stat.st_dev, stat.st_ino
+
+    def refresh(self) -> int:
+        """
+        Remaps the log once lines were appended to it (e.g. live sessions), the line offsets being extended from
+        the last line indexed rather than rebuilt, up to the last complete line. Returns the position of the first
+        line not indexed before, or of the last one indexed if it was partial. If the log was rotated (i.e. replaced
+        or truncated), it is indexed from its start again, and 0 is returned.
+        """
+        if is_compressed(self.filepath):
+            raise ValueError(f'Compressed log {self.filepath} cannot be refreshed')
+        self._open()
+        offsets = self._offsets
+        # NOTE: start of the first line to index, the partial last line (if any) being indexed again
+        offsets = offsets[:-1] if self.is_partial() else offsets
+        file_id = self._file_id
+        self.close()
+        with open(self.filepath, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        if (stat.st_dev, stat.st_ino) != file_id or stat.st_size < offsets[-1]:
+            offsets = array('q', [0])
+        first_position = len(offsets) - 1
+        offsets = offsets[:-1] + build_line_offsets(mapped, start=offsets[-1])
+        if offsets[-1] > 0 and mapped[offsets[-1] - 1:offsets[-1]] != b'\n':
+            # NOTE: a trailing line still being written is indexed by a later refresh
+            offsets.pop()
+        if self.persist_index:
+            _save_line_offsets(self.filepath + LINE_INDEX_SUFFIX, stat, offsets)
+        self._mapped = mapped
+        self._offsets = offsets
+        self._file_id = stat.st_dev, stat.st_ino
+        return first_position
+
+    def is_partial(self) -> bool:
+        # whether the last line is not terminated (e.g. still being written)
+        self._open()
+        end = self._offsets[-1]
+        return end > 0 and self._mapped[end - 1:end] != b'\n'
+
+    def __getstate__(self):
+        # NOTE: the mapping is not pickled, only where to map it from
+        return {'filepath': self.filepath, 'persist_index': self.persist_index, '_mapped': None, '_offsets': None, '_file_id': None}
+
+    def __len__(self):
+        self._open()
+        return len(self._offsets) - 1
+
+    def get_line(self, idx) -> str:
+        self._open()
+        return self._mapped[self._offsets[idx]:self._offsets[idx + 1]].decode('utf-8')
+
+    def get_entry(self, idx) -> LogEntry:
+        return _parse_log_line(idx, self.get_line(idx))
+
+    def get_entry_by_id(self, entry_id) -> LogEntry:
+        # NOTE: entry ids are the positions of their lines, None if there is no such entry
+        if not 0 <= entry_id < len(self):
+            return None
+        return self.get_entry(entry_id)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self.get_entry(entry_idx) for entry_idx in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f'Log entry index out of range: {idx}')
+        return self.get_entry(idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.get_entry(idx)
+
+    def to_entries(self) -> List[LogEntry]:
+        return list(self)
+
+    def close(self):
+        if isinstance(self._mapped, mmap.mmap):
+            self._mapped.close()
+        self._mapped = None
+        self._offsets = None
+        self._file_id = None
+
+    def __repr__(self):
+        return f'MappedLogStore(filepath={self.filepath!r})'
+
+
+class MappedLogView:
+    """
+    Subset of the entries of a `MappedLogStore` (e.g. of one notebook), by their positions in the whole log.
+    Shares the mapping of the store, only the positions (8 bytes per entry) are kept on top of it.
+    """
+    def __init__(self, store, positions):
+        if isinstance(store, MappedLogView):
+            # NOTE: view of a view, positions are those of the whole log
+            positions = array('q', (store.positions[position] for position in positions))
+            store = store.store
+        self.store = store
+        self.positions = positions if isinstance(positions, array) else array('q', positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get_entry_by_id(self, entry_id) -> LogEntry:
+        # NOTE: any entry of the whole log (e.g. neighbours of the entries of the view)
+        return self.store.get_entry_by_id(entry_id)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self.store.get_entry(position) for position in self.positions[idx]]
+        return self.store.get_entry(self.positions[idx])
+
+    def __iter__(self):
+        for position in self.positions:
+            yield self.store.get_entry(position)
+
+    def to_entries(self) -> List[LogEntry]:
+        return list(self)
+
+    def close(self):
+        self.store.close()
+
+    def __repr__(self):
+        return f'MappedLogView(store={self.store!r}, num_entries={len(self)})'
@@ -1,6 +1,11 @@
+import os
 import re
+import sys
 from datetime import datetime
+from typing import Dict, List
 from tabulate import tabulate
+from parsers.compression import open_file, is_compressed, strip_compression_suffix
+from parsers.log_sessions import SessionBreakReport, detect_session_breaks
 
 # from enum import Enum
 # class LogEntryType(Enum):
@@ -11,19 +16,53 @@ from tabulate import tabulate
 #     TASK_WHAT_WHY_TIME = 'TASK_WHAT_WHY_TIME'
 
 
+def _intern(value):
+    # NOTE: low-cardinality fields (types, subjects, users, notebooks, ..) share one string object across entries
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class LogEntry:
+    __slots__ = (
+        'id', 'entry_type', 'subject', 'user', 'context', 'notebook',
+        'session_type', 'timestamp', '_timestamp_ms', 'content', 'cell_type'
+    )
+    # NOTE: timestamp_ms is derived from timestamp, hence not compared
+    _FIELDS = ('id', 'entry_type', 'subject', 'user', 'context', 'notebook', 'session_type', 'timestamp', 'content', 'cell_type')
+
     def __init__(self, _id, entry_type, subject, user, context, notebook, session_type, timestamp, content=None, cell_type=None):
         self.id = _id
-        self.entry_type = entry_type
-        self.subject = subject
-        self.user = user
-        self.context = context
-        self.notebook = notebook
-        self.session_type = session_type
+        self.entry_type = _intern(entry_type)
+        self.subject = _intern(subject)
+        self.user = _intern(user)
+        self.context = _intern(context)
+        self.notebook = _intern(notebook)
+        self.session_type = _intern(session_type)
         self.timestamp = timestamp
-        self.timestamp_ms = self.convert_to_ms(timestamp)
+        self._timestamp_ms = None # NOTE: converted lazily on first access
         self.content = content
-        self.cell_type = cell_type
+        self.cell_type = _intern(cell_type)
+
+    @property
+    def timestamp_ms(self):
+        if self._timestamp_ms is None:
+            self._timestamp_ms = self.convert_to_ms(self.timestamp)
+        return self._timestamp_ms
+
+    @timestamp_ms.setter
+    def timestamp_ms(self, v):
+        self._timestamp_ms = v
+
+    def _astuple(self):
+        return tuple(getattr(self, field) for field in self._FIELDS)
+
+    def __eq__(self, other):
+        if isinstance(other, LogEntry):
+            return self._astuple() == other._astuple()
+        else:
+            return False
+
+    def __hash__(self):
+        return hash((self.id, self.entry_type, self.notebook, self.timestamp))
 
     def __str__(self):
         return f"{self.entry_type}::{self.subject}::{self.user}::{self.context}::{self.notebook}::{self.timestamp}::{self.content}::{self.cell_type}"
@@ -82,30 +121,310 @@ class LogEntry:
 
     def set_content(self, content, cell_type):
         self.content = content
-        self.cell_type = cell_type
+        self.cell_type = _intern(cell_type)
 
     def convert_to_ms(self, timestamp):
-        # Assuming that timestamps are in the format 'YYYY-MM-DDTHH:MM:SS.xxxxxx'
-        try:
-            timestamp_datetime = datetime.fromisoformat(timestamp)
-            timestamp_ms = int(timestamp_datetime.timestamp() * 1000)
-            return timestamp_ms
-        except TypeError:
-            return timestamp
-        except ValueError:
-            return timestamp
+        return _convert_to_ms(timestamp)
+
+
+def _convert_to_ms(timestamp):
+    # Assuming that timestamps are in the format 'YYYY-MM-DDTHH:MM:SS.xxxxxx'
+    try:
+        timestamp_datetime = datetime.fromisoformat(timestamp)
+        timestamp_ms = int(timestamp_datetime.timestamp() * 1000)
+        return timestamp_ms
+    except TypeError:
+        return timestamp
+    except ValueError:
+        return timestamp
+
+
+def _split_log_line(line) -> List[str]:
+    # entry_type:::subject:::user:::context:::notebook:::session_type:::timestamp[:::content[:::cell_type]]
+    parts = line.strip().split(":::")
+    if len(parts) < 7:
+        raise Exception(f"Invalid log entry: {line}")
+    return parts
+
+
+def _parse_log_line(entry_id, line) -> LogEntry:
+    parts = _split_log_line(line)
+    entry_type = parts[0]
+    subject = parts[1]
+    user = parts[2]
+    context = parts[3]
+    notebook = parts[4]
+    session_type = parts[5]
+    timestamp = parts[6]
+    entry = LogEntry(entry_id, entry_type, subject, user, context, notebook, session_type, timestamp)
+    content = parts[7] if len(parts) >= 8 else None
+    cell_type = parts[8] if len(parts) >= 9 else None
+    entry.set_content(content, cell_type)
+    return entry
+
+
+# NOTE: fields of the log lines, in order (the entry id being the line position)
+LOG_LINE_FIELDS = ('entry_type', 'subject', 'user', 'context', 'notebook', 'session_type', 'timestamp', 'content', 'cell_type')
+
+
+def make_log_line_parser(entry_types=None, notebooks=None, fields=None):
+    """
+    Parser of log lines (`(entry_id, line) -> LogEntry`, None for the filtered out lines) with the filters and
+    projection pushed down to the raw line, i.e. filtered out lines are never turned into entries.
+    entry_types: only lines of these entry types are parsed, checked (as a prefix) before the line is even split
+    notebooks: only lines of these notebooks are parsed
+    fields: only these fields (see `LOG_LINE_FIELDS`) are kept, the others are None
+    """
+    if entry_types is None and notebooks is None and fields is None:
+        return _parse_log_line
+    entry_type_prefixes = None if entry_types is None else tuple(f'{entry_type}:::' for entry_type in entry_types)
+    notebooks = None if notebooks is None else frozenset(notebooks)
+    keep_entry_type, keep_subject, keep_user, keep_context, keep_notebook, keep_session_type, keep_timestamp, keep_content, keep_cell_type = (
+        fields is None or field in fields for field in LOG_LINE_FIELDS
+    )
+    new_entry = LogEntry.__new__
+
+    def _parse_filtered_log_line(entry_id, line):
+        if entry_type_prefixes is not None and not line.startswith(entry_type_prefixes):
+            return None
+        parts = _split_log_line(line)
+        if notebooks is not None and parts[4] not in notebooks:
+            return None
+        # NOTE: slots are filled in directly, only the kept fields being interned
+        entry = new_entry(LogEntry)
+        entry.id = entry_id
+        entry.entry_type = _intern(parts[0]) if keep_entry_type else None
+        entry.subject = _intern(parts[1]) if keep_subject else None
+        entry.user = _intern(parts[2]) if keep_user else None
+        entry.context = _intern(parts[3]) if keep_context else None
+        entry.notebook = _intern(parts[4]) if keep_notebook else None
+        entry.session_type = _intern(parts[5]) if keep_session_type else None
+        entry.timestamp = parts[6] if keep_timestamp else None
+        entry._timestamp_ms = None
+        entry.content = parts[7] if keep_content and len(parts) > 7 else None
+        entry.cell_type = _intern(parts[8]) if keep_cell_type and len(parts) > 8 else None
+        return entry
+
+    return _parse_filtered_log_line
+
+
+def iter_log_entries(filepath, entry_types=None, notebooks=None, fields=None):
+    """
+    Yields the entries of the log file one at a time, reading it line by line (i.e. in bounded memory).
+    Compressed logs (e.g. `.log.gz`) are decompressed on the fly.
+    entry_types, notebooks, fields: filters and projection applied while parsing, see `make_log_line_parser`
+    """
+    parse_line = make_log_line_parser(entry_types=entry_types, notebooks=notebooks, fields=fields)
+    with open_file(filepath, 'r') as file:
+        for entry_id, line in enumerate(file):
+            entry = parse_line(entry_id, line)
+            if entry is not None:
+                yield entry
+
+
+def _read_log_entries(file, first_entry_id=0, include_partial=True, parse_line=_parse_log_line):
+    """
+    Parses the lines of a log file opened in binary mode, from its current position.
+    Returns the entries, the byte offset past the last complete line, the id of the line after it and
+    whether the last entry comes from a partial (i.e. not yet terminated) line, which is only parsed
+    if `include_partial` and valid.
+    """
+    entries = []
+    offset = file.tell()
+    next_entry_id = first_entry_id
+    partial = False
+    for entry_id, line in enumerate(file, first_entry_id):
+        if not line.endswith(b'\n'):
+            if include_partial:
+                try:
+                    entry = parse_line(entry_id, line.decode('utf-8'))
+                    if entry is not None:
+                        entries.append(entry)
+                        partial = True
+                except (Exception, UnicodeDecodeError):
+                    # NOTE: cut while being written, left for `LogParser.refresh`
+                    pass
+            break
+        entry = parse_line(entry_id, line.decode('utf-8'))
+        if entry is not None:
+            entries.append(entry)
+        offset += len(line)
+        next_entry_id = entry_id + 1
+    return entries, offset, next_entry_id, partial
+
+
+def _skip_log_lines(file, num_lines) -> int:
+    # byte offset past the first `num_lines` lines
+    offset = 0
+    for _, line in zip(range(num_lines), file):
+        offset += len(line)
+    return offset
+
+
+def _get_file_id(file):
+    stat = os.fstat(file.fileno())
+    return stat.st_dev, stat.st_ino
+
+
+class _LogTail:
+    # how far a log file was consumed: byte offset past its last complete line (None if unknown, e.g. loaded
+    # from columns), identity of the file (to detect rotations), id of the next line and whether the last entry
+    # is from a partial line
+    __slots__ = ('offset', 'file_id', 'next_entry_id', 'partial')
+
+    def __init__(self, offset=None, file_id=None, next_entry_id=0, partial=False):
+        self.offset = offset
+        self.file_id = file_id
+        self.next_entry_id = next_entry_id
+        self.partial = partial
+
+
+# NOTE: fields queried by `get_only`/`get_filtered` through inverted indexes, any other field is scanned
+INDEXED_FIELDS = ('notebook', 'entry_type', 'cell_type', 'user', 'id')
+
 
 class LogParser:
-    def __init__(self, filepath):
+    def __init__(self, filepath, lazy=False, columnar=False, cache=None, mapped=False, entry_types=None, notebooks=None, fields=None):
+        # lazy: entries are only read (once) when first needed, see `iter_entries` to stream them instead
+        # columnar: entries are loaded into a `ColumnarLogStore` (requires numpy), `LogEntry` objects
+        # are only created when indexed (or if `entries` is accessed)
+        # cache: `LogCache` the columns are loaded from (or saved to), instead of parsing the log every run
+        # mapped: the log is memory-mapped (see `MappedLogStore`), entries are only decoded when indexed
+        # entry_types, notebooks, fields: only the entries of these types and notebooks are kept, with only these fields,
+        # filtered while parsing (see `make_log_line_parser`); entries ids remain their lines positions, hence session
+        # breaks cannot be detected once filtered by type (see `get_session_breaks`)
         self.filepath = filepath
-        self.parse()
+        self._pushdown = None
+        if entry_types is not None or notebooks is not None or fields is not None:
+            if mapped:
+                raise ValueError('Memory-mapped logs cannot be filtered while parsing')
+            self._pushdown = {'entry_types': entry_types, 'notebooks': notebooks, 'fields': fields}
+        self._entries = None
+        self._indexes = {}
+        self._columns = None
+        # NOTE: random access to the whole log by entry id, kept by the views (see `get_entry_by_id`)
+        self._mapped_log = None
+        self._tail = _LogTail()
+        if mapped:
+            from parsers.log_mmap import MappedLogStore
+            self._mapped_log = MappedLogStore(filepath)
+        elif cache is not None:
+            self._columns = self._filter_columns(cache.get(filepath))
+            if not (lazy or columnar):
+                self._entries = self._columns.to_entries()
+        elif columnar:
+            from parsers.log_columns import ColumnarLogStore
+            self._columns = self._filter_columns(ColumnarLogStore.from_file(filepath))
+        elif not lazy:
+            self.parse()
+
+    def _filter_columns(self, columns):
+        # NOTE: vectorized, the columns being already parsed; the projection does not apply to them
+        if self._pushdown is None:
+            return columns
+        conditions = {
+            field: list(self._pushdown[key])
+            for field, key in (('entry_type', 'entry_types'), ('notebook', 'notebooks'))
+            if self._pushdown[key] is not None
+        }
+        return columns.get_only(**conditions) if conditions else columns
+
+    def _make_line_parser(self):
+        return make_log_line_parser(**(self._pushdown or {}))
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            if self._columns is not None:
+                self._entries = self._columns.to_entries()
+            elif self._mapped_log is not None:
+                self._entries = self._mapped_log.to_entries()
+            else:
+                self.parse()
+        return self._entries
+
+    @entries.setter
+    def entries(self, entries):
+        # NOTE: entries set from outside (e.g. filtered) no longer follow the log file, see `refresh`
+        self._entries = entries
+        self._indexes = {}
+        self._columns = None
+        self._tail = None
+
+    @property
+    def columns(self):
+        # columnar view of the entries for vectorized analytics, see `ColumnarLogStore`
+        if self._columns is None:
+            from parsers.log_columns import ColumnarLogStore
+            self._columns = ColumnarLogStore.from_entries(self.iter_entries())
+        return self._columns
+
+    def __getstate__(self):
+        # NOTE: indexes are rebuilt on demand rather than shipped along
+        state = self.__dict__.copy()
+        state['_indexes'] = {}
+        return state
+
+    def _get_index(self, field):
+        # field value -> positions (ascending) of the entries with that value, built on first query
+        if field not in self._indexes:
+            index = {}
+            # NOTE: entries of memory-mapped logs are decoded one at a time, not kept in memory
+            for entry_idx, entry in enumerate(self._get_entries()):
+                index.setdefault(getattr(entry, field), []).append(entry_idx)
+            self._indexes[field] = index
+        return self._indexes[field]
+
+    def _get_positions(self, field, values):
+        positions_per_value = [self._get_index(field).get(value, []) for value in values]
+        if len(positions_per_value) == 1:
+            return positions_per_value[0]
+        return sorted(set().union(*positions_per_value))
+
+    def iter_entries(self):
+        # streams the entries from the file, unless they are already materialized
+        if self._entries is not None:
+            return iter(self._entries)
+        if self._columns is not None:
+            return iter(self._columns)
+        if self._mapped_log is not None:
+            return iter(self._mapped_log)
+        return iter_log_entries(self.filepath, **(self._pushdown or {}))
+
+    def _get_store(self):
+        # entries not materialized (yet) but randomly accessible, if any
+        if self._entries is not None:
+            return None
+        return self._columns if self._columns is not None else self._mapped_log
 
     def __len__(self):
+        store = self._get_store()
+        if store is not None:
+            return len(store)
         return len(self.entries)
 
     def __getitem__(self, idx):
+        store = self._get_store()
+        if store is not None and isinstance(idx, int):
+            return store[idx]
         return self.entries[idx]
 
+    def get_entry_by_id(self, entry_id) -> LogEntry:
+        # entry of the whole log if memory-mapped (e.g. neighbours of the entries of a view), otherwise of these entries
+        if self._mapped_log is not None:
+            return self._mapped_log.get_entry_by_id(entry_id)
+        entries = self.get_only(id=entry_id)
+        return entries[0] if entries else None
+
+    def _get_entries(self):
+        # entries by position: the memory-mapped log (decoded when indexed) if not materialized
+        if self._entries is None and self._mapped_log is not None:
+            return self._mapped_log
+        return self.entries
+
+    def __iter__(self):
+        return iter(self._get_entries())
+
     # def print(self, text_width=100, compact=True):
     #     print('='*text_width)
     #     print('filepath:', self.filepath)
@@ -121,152 +440,280 @@ class LogParser:
 
 
     def parse(self):
-        self.entries = []
-        with open(self.filepath, 'r') as file:
-            for entry_id, line in enumerate(file):
-                parts = line.strip().split(":::")
-                if len(parts) >= 7:
-                    entry_type = parts[0]
-                    subject = parts[1]
-                    user = parts[2]
-                    context = parts[3]
-                    notebook = parts[4]
-                    session_type = parts[5]
-                    timestamp = parts[6]
-                    entry = LogEntry(entry_id, entry_type, subject, user, context, notebook, session_type, timestamp)
-                    content = parts[7] if len(parts) >= 8 else None
-                    cell_type = parts[8] if len(parts) >= 9 else None
-                    entry.set_content(content, cell_type)
-
-                    self.entries.append(entry)
-                else:
-                    raise Exception(f"Invalid log entry: {line}")
+        if is_compressed(self.filepath):
+            # NOTE: archived logs, i.e. not growing, hence not followed (see `refresh`)
+            self.entries = list(iter_log_entries(self.filepath, **(self._pushdown or {})))
+            return self
+        with open(self.filepath, 'rb') as file:
+            file_id = _get_file_id(file)
+            entries, offset, next_entry_id, partial = _read_log_entries(file, parse_line=self._make_line_parser())
+        self.entries = entries
+        self._tail = _LogTail(offset, file_id, next_entry_id, partial)
         return self
 
+    def refresh(self) -> List[LogEntry]:
+        """
+        Parses only the complete lines appended to the log file since it was last read (e.g. live sessions),
+        and returns their entries (the last entry being parsed again if its line was partial).
+        A trailing line still being written is left for a later refresh.
+        If the log file was rotated (i.e. replaced or truncated), the new one is read from its start,
+        its entries ids following the ones already parsed.
+        """
+        if self._tail is None or is_compressed(self.filepath):
+            raise Exception(f'Log parser of {self.filepath} cannot be refreshed, its entries were not parsed from the whole (uncompressed) log')
+        if self._entries is None and self._columns is None:
+            if self._mapped_log is None:
+                # NOTE: lazy parser whose entries were not read yet, they are all read now (none being new)
+                self.parse()
+                return []
+            return self._refresh_mapped_log()
+        entries = self.entries
+        tail = self._tail
+        with open(self.filepath, 'rb') as file:
+            file_id = _get_file_id(file)
+            if tail.offset is None:
+                # NOTE: done once, e.g. for entries loaded from columns; the last entry is considered partial
+                # since its line might have been completed since then, i.e. it is parsed again
+                if entries:
+                    # NOTE: entries ids are their lines positions (even if some lines were filtered out)
+                    tail = _LogTail(_skip_log_lines(file, entries[-1].id), file_id, entries[-1].id, partial=True)
+                else:
+                    tail = _LogTail(0, file_id)
+            if tail.file_id != file_id or os.fstat(file.fileno()).st_size < tail.offset:
+                # NOTE: the partial line of the rotated file (if any) is final, and entries ids no longer
+                # match the lines of the log file
+                tail = _LogTail(0, file_id, tail.next_entry_id + (1 if tail.partial else 0), partial=False)
+                self._mapped_log = None
+            file.seek(tail.offset)
+            new_entries, offset, next_entry_id, _ = _read_log_entries(
+                file, tail.next_entry_id, include_partial=False, parse_line=self._make_line_parser()
+            )
+        if tail.partial and next_entry_id > tail.next_entry_id:
+            # NOTE: the entry of the partial line is replaced by the one of the completed line (if not filtered out)
+            self._remove_last_entry()
+        if new_entries:
+            self._append_entries(new_entries)
+        self._tail = _LogTail(offset, file_id, next_entry_id, partial=tail.partial and next_entry_id == tail.next_entry_id)
+        return new_entries
+
+    def _refresh_mapped_log(self):
+        # NOTE: the memory-mapped log is indexed from the last line it indexed, the entries not being materialized;
+        # its entries ids are the positions of its lines, hence those of a rotated log start from 0 again
+        mapped_log = self._mapped_log
+        last_entry = mapped_log[-1] if len(mapped_log) and mapped_log.is_partial() else None
+        first_position = mapped_log.refresh()
+        if first_position == 0:
+            self._indexes = {}
+        elif last_entry is not None:
+            # NOTE: the entry of the partial line is replaced by the one of the completed line
+            for field, index in self._indexes.items():
+                positions = index[getattr(last_entry, field)]
+                positions.pop()
+                if not positions:
+                    del index[getattr(last_entry, field)]
+        new_entries = mapped_log[first_position:]
+        for field, index in self._indexes.items():
+            for entry_idx, entry in enumerate(new_entries, first_position):
+                index.setdefault(getattr(entry, field), []).append(entry_idx)
+        return new_entries
+
+    def _append_entries(self, new_entries):
+        # NOTE: built indexes are extended rather than rebuilt, columns are rebuilt on demand
+        first_idx = len(self._entries)
+        self._entries.extend(new_entries)
+        for field, index in self._indexes.items():
+            for entry_idx, entry in enumerate(new_entries, first_idx):
+                index.setdefault(getattr(entry, field), []).append(entry_idx)
+        self._columns = None
+        if self._mapped_log is not None:
+            # NOTE: remapped (and reindexed) on next access
+            self._mapped_log.close()
+
+    def _remove_last_entry(self):
+        entry = self._entries.pop()
+        for field, index in self._indexes.items():
+            positions = index[getattr(entry, field)]
+            positions.pop()
+            if not positions:
+                del index[getattr(entry, field)]
+        self._columns = None
+
 
     def find_first_entry_by_content(self, content):
-        for entry in self.entries:
+        for entry in self._get_entries():
             if entry.content == content:
                 return entry
         return None
 
     def get_only_entries_with_content(self):
-        return [entry for entry in self.entries if entry.content is not None]
+        return [entry for entry in self._get_entries() if entry.content is not None]
 
     def get_only(self, **kwargs):
-        filtered = self.entries
-        for key, value in kwargs.items():
-            if not isinstance(value, list):
-                value = [value]
+        conditions = {
+            key: value if isinstance(value, list) else [value]
+            for key, value in kwargs.items()
+        }
+        indexed_keys = [key for key in conditions if key in INDEXED_FIELDS]
+        if indexed_keys:
+            # NOTE: candidates from the most selective index, the other conditions are only checked on them
+            positions = min(
+                (self._get_positions(key, conditions[key]) for key in indexed_keys),
+                key=len
+            )
+            entries = self._get_entries()
+            filtered = [entries[entry_idx] for entry_idx in positions]
+        else:
+            filtered = self._get_entries()
+        for key, value in conditions.items():
             filtered = [entry for entry in filtered if getattr(entry, key) in value]
-        return filtered
+        return filtered if isinstance(filtered, list) else list(filtered)
 
     def get_filtered(self, **kwargs):
-        filtered = self.entries
+        excluded_positions = set()
+        scanned_conditions = {}
         for key, value in kwargs.items():
             if not isinstance(value, list):
                 value = [value]
+            if key in INDEXED_FIELDS:
+                excluded_positions.update(self._get_positions(key, value))
+            else:
+                scanned_conditions[key] = value
+        filtered = [entry for entry_idx, entry in enumerate(self._get_entries()) if entry_idx not in excluded_positions]
+        for key, value in scanned_conditions.items():
             filtered = [entry for entry in filtered if getattr(entry, key) not in value]
         return filtered
 
     def get_entry_types(self):
-        return set([entry.entry_type for entry in self.entries])
+        return set([entry.entry_type for entry in self.iter_entries()])
 
     def get_cell_types(self):
-        return set([entry.cell_type for entry in self.entries if entry.cell_type is not None])
+        return set([entry.cell_type for entry in self.iter_entries() if entry.cell_type is not None])
 
     def get_users(self):
-        return set([entry.user for entry in self.entries])
+        return set([entry.user for entry in self.iter_entries()])
 
     def get_notebooks(self):
-        return set([entry.notebook for entry in self.entries])
+        return set([entry.notebook for entry in self.iter_entries()])
 
     def _keep_only_entries_by_filter(self, **kwargs):
-        filtered = self.entries
-        for key, value in kwargs.items():
-            if not isinstance(value, list):
-                value = [value]
-            filtered = [entry for entry in filtered if getattr(entry, key) in value]
-        self.entries = filtered
+        self.entries = self.get_only(**kwargs)
         return self
 
+    def _view(self, entries) -> 'LogParser':
+        # parser over a subset of the entries, sharing them (i.e. nothing is copied)
+        view = self.__class__.__new__(self.__class__)
+        view.__dict__.update(self.__dict__)
+        view.entries = entries
+        return view
+
+    def _mapped_view(self, positions) -> 'LogParser':
+        # parser over a subset of the entries of a memory-mapped log, by their positions (see `MappedLogView`)
+        from parsers.log_mmap import MappedLogView
+        view = self.__class__.__new__(self.__class__)
+        view.__dict__.update(self.__dict__)
+        view._indexes = {}
+        view._tail = None
+        view._mapped_log = MappedLogView(self._mapped_log, positions)
+        return view
+
     def divide_per_notebook(self, notebooks_names=None):
-        from copy import deepcopy
+        # NOTE: single pass over the entries (the notebook index), bucketed into per notebook views
         if notebooks_names is None:
-            notebooks = self.get_notebooks()
+            notebooks_names = sorted(self.get_notebooks())
+        notebook_index = self._get_index('notebook')
+        entries = self._get_entries()
         log_parsers = {}
         for notebook in notebooks_names:
-            log_parsers[notebook] = deepcopy(self)._keep_only_entries_by_filter(notebook=notebook)
+            positions = notebook_index.get(notebook, [])
+            if entries is self._mapped_log:
+                # NOTE: memory-mapped views only keep the positions of their entries
+                log_parsers[notebook] = self._mapped_view(positions)
+            else:
+                log_parsers[notebook] = self._view([entries[entry_idx] for entry_idx in positions])
         return log_parsers
 
     def is_one_notebook_log(self):
         return len(self.get_notebooks()) == 1
 
+    def _check_session_breaks_detectable(self):
+        # NOTE: entries filtered out by type leave gaps in the ids, i.e. spurious breaks, and idle times need the
+        # timestamps; entries filtered out by notebook are fine, entries of other notebooks being breaks anyway
+        if self._pushdown is None:
+            return
+        fields = self._pushdown['fields']
+        if self._pushdown['entry_types'] is not None or (fields is not None and 'timestamp' not in fields):
+            raise ValueError(
+                f'Session breaks of {self.filepath} cannot be detected, its entries were filtered by type '
+                'or without their timestamps while parsing'
+            )
+
+    def get_session_breaks(self, notebooks=None, keep_entries=False) -> SessionBreakReport:
+        # runs of consecutive entries per notebook and the breaks between them, in a single pass
+        self._check_session_breaks_detectable()
+        return detect_session_breaks(self.iter_entries(), notebooks=notebooks, keep_entries=keep_entries)
+
+    def split_sessions(self, notebooks=None) -> Dict[str, List['LogParser']]:
+        # per notebook, one parser (view) per run of consecutive entries, i.e. per uninterrupted session
+        report = self.get_session_breaks(notebooks=notebooks, keep_entries=True)
+        return {
+            notebook: [self._view(run.entries) for run in runs]
+            for notebook, runs in report.runs_per_notebook.items()
+        }
+
+    def _print_session_break(self, session_break):
+        print('='*20)
+        print('Non consecutive entries:')
+        print(session_break.before.last_id, session_break.after.first_id, f'(idle for {session_break.idle_ms} ms)')
+        right_after_entry = self.get_entry_by_id(session_break.before.last_id+1)
+        if right_after_entry is not None:
+            print(right_after_entry.id)
+            print(right_after_entry)
+        left_before_entry = self.get_entry_by_id(session_break.after.first_id-1)
+        if left_before_entry is not None:
+            print(left_before_entry.id)
+            print(left_before_entry)
+        print('='*20)
+
     def is_continous_notebook_log(self, verbose=False):
-        if not self.is_one_notebook_log():
+        report = self.get_session_breaks()
+        if len(report.runs_per_notebook) != 1:
             return False
-        for entry_1, entry_2 in zip(self.entries, self.entries[1:]):
-            if entry_2.id - entry_1.id != 1:
-                if verbose:
-                    print('='*20)
-                    print('Non consecutive entries:')
-                    print(entry_1.id, entry_2.id)
-                    right_after_entry = self.get_only(id=entry_1.id+1)[0]
-                    print(right_after_entry.id)
-                    right_after_entry.print()
-                    left_before_entry = self.get_only(id=entry_2.id-1)[0]
-                    print(left_before_entry.id)
-                    left_before_entry.print()
-                    print('='*20)
-                return False
-        return True
+        if verbose:
+            for session_break in report.get_breaks():
+                self._print_session_break(session_break)
+        return report.is_continuous()
 
     def of_continous_logs(self, all_training_notebooks_filepathes=None):
-        notebooks = self.get_notebooks()
+        notebooks = None
         if all_training_notebooks_filepathes is not None:
-            notebooks = notebooks.intersection(all_training_notebooks_filepathes)
-
-        for notebook in sorted(notebooks):
-            content_entries = self.get_only(notebook=notebook)
-            for entry_1, entry_2 in zip(content_entries[:-1], content_entries[1:]):
-                if entry_2.id - entry_1.id != 1:
-                    return False
-        return True
+            notebooks = set(all_training_notebooks_filepathes)
+        return self.get_session_breaks(notebooks=notebooks).is_continuous()
 
     # Verification if the logs include a broken session
     # (meaning opened and closed then opened again after some time)
     def debug_noncontinous_logs(self, all_training_notebooks_filepathes=None):
-
-        notebooks = self.get_notebooks()
+        notebooks = None
         if all_training_notebooks_filepathes is not None:
-            notebooks = notebooks.intersection(all_training_notebooks_filepathes)
+            notebooks = set(all_training_notebooks_filepathes)
+        report = self.get_session_breaks(notebooks=notebooks)
 
-        for notebook in sorted(notebooks):
+        for notebook in sorted(report.runs_per_notebook):
             print('='*20)
             print('Notebook:', notebook)
-            content_entries = self.get_only(notebook=notebook)
-            print(f'Number of entries: {len(content_entries)}')
-            broken_session = False
-            for entry_1, entry_2 in zip(content_entries[:-1], content_entries[1:]):
-                if entry_2.id - entry_1.id != 1:
-                    broken_session = True
-                    print('='*20)
-                    print('Non consecutive entries:')
-                    print(entry_1.id, entry_2.id)
-                    right_after_entry = self.get_only(id=entry_1.id+1)[0]
-                    print(right_after_entry.id)
-                    right_after_entry.print()
-                    left_before_entry = self.get_only(id=entry_2.id-1)[0]
-                    print(left_before_entry.id)
-                    left_before_entry.print()
-                    print('='*20)
-            if not broken_session:
+            runs = report.runs_per_notebook[notebook]
+            print(f'Number of entries: {sum(run.num_entries for run in runs)}')
+            session_breaks = report.get_breaks(notebook)
+            for session_break in session_breaks:
+                self._print_session_break(session_break)
+            if not session_breaks:
                 print('All entries are consecutive')
+        return report
 
     def attach_notebooks(self,
         notebooks_dir, verbose=False,
         filter=lambda x: re.match(r'[A-Z]-subject-.+.ipynb', x),
         # filter=lambda x: x.startswith('X-subject')
+        lazy_outputs=False,
     ):
         import os
         from utils import get_all_file_with_extension_in_dir_recursively
@@ -275,10 +722,10 @@ class LogParser:
         if verbose: print(f'Filtering notebooks with filter: {filter.__name__}')
 
         nb_filepaths_dict = {
-            os.path.basename(nb_filepath): nb_filepath
+            os.path.basename(strip_compression_suffix(nb_filepath)): nb_filepath
             for nb_filepath in
             get_all_file_with_extension_in_dir_recursively(notebooks_dir, ".ipynb")
-            if filter(os.path.basename(nb_filepath))
+            if filter(os.path.basename(strip_compression_suffix(nb_filepath)))
         }
         if verbose:
             print(f'\nThere are total {len(nb_filepaths_dict)} notebooks found in {notebooks_dir} directory')
@@ -293,7 +740,7 @@ class LogParser:
         nb_sublog_dict = self.divide_per_notebook(found_related_notebooks)
 
         nb_sublog_dict = {
-            nb_filepaths_dict[nb_filename]: (log_parser, NotebookParser(nb_filepaths_dict[nb_filename]))
+            nb_filepaths_dict[nb_filename]: (log_parser, NotebookParser(nb_filepaths_dict[nb_filename], lazy_outputs=lazy_outputs))
             for nb_filename, log_parser in nb_sublog_dict.items()
         }
 
@@ -0,0 +1,124 @@
+from typing import Dict, List
+from tabulate import tabulate
+
+
+class LogRun:
+    """
+    Contiguous entries (i.e. consecutive ids) of one notebook, e.g. one uninterrupted session on it.
+    `entries` are only kept if asked for, see `detect_session_breaks`.
+    """
+    __slots__ = ('notebook', 'first_entry', 'last_entry', 'num_entries', 'entries')
+
+    def __init__(self, notebook, first_entry, entries=None):
+        self.notebook = notebook
+        self.first_entry = first_entry
+        self.last_entry = first_entry
+        self.num_entries = 1
+        self.entries = entries
+
+    @property
+    def first_id(self) -> int:
+        return self.first_entry.id
+
+    @property
+    def last_id(self) -> int:
+        return self.last_entry.id
+
+    @property
+    def duration_ms(self) -> int:
+        return _elapsed_ms(self.first_entry, self.last_entry)
+
+    def __repr__(self):
+        return f'LogRun(notebook={self.notebook!r}, ids=[{self.first_id}:{self.last_id + 1}])'
+
+
+class SessionBreak:
+    # gap between two consecutive runs of the same notebook, i.e. entries of other notebooks (or missing ones) in between
+    __slots__ = ('notebook', 'before', 'after')
+
+    def __init__(self, notebook, before: LogRun, after: LogRun):
+        self.notebook = notebook
+        self.before = before
+        self.after = after
+
+    @property
+    def num_skipped_entries(self) -> int:
+        return self.after.first_id - self.before.last_id - 1
+
+    @property
+    def idle_ms(self) -> int:
+        # time between the last entry before the break and the first one after it, None if not comparable
+        return _elapsed_ms(self.before.last_entry, self.after.first_entry)
+
+    def __repr__(self):
+        return f'SessionBreak(notebook={self.notebook!r}, ids={self.before.last_id}->{self.after.first_id}, idle_ms={self.idle_ms})'
+
+
+def _elapsed_ms(entry_1, entry_2):
+    # NOTE: timestamps that could not be converted are kept as strings, see `_convert_to_ms`
+    start_ms, end_ms = entry_1.timestamp_ms, entry_2.timestamp_ms
+    if isinstance(start_ms, int) and isinstance(end_ms, int):
+        return end_ms - start_ms
+    return None
+
+
+class SessionBreakReport:
+    """
+    Runs of contiguous entries per notebook, and the session breaks between them.
+    """
+    def __init__(self, runs_per_notebook: Dict[str, List[LogRun]]):
+        self.runs_per_notebook = runs_per_notebook
+
+    def get_breaks(self, notebook=None) -> List[SessionBreak]:
+        notebooks = sorted(self.runs_per_notebook) if notebook is None else [notebook]
+        return [
+            SessionBreak(notebook, run_before, run_after)
+            for notebook in notebooks
+            for run_before, run_after in zip(self.runs_per_notebook.get(notebook, []), self.runs_per_notebook.get(notebook, [])[1:])
+        ]
+
+    def is_continuous(self, notebook=None) -> bool:
+        notebooks = self.runs_per_notebook if notebook is None else [notebook]
+        return all(len(self.runs_per_notebook.get(notebook, [])) <= 1 for notebook in notebooks)
+
+    def get_broken_notebooks(self) -> List[str]:
+        return sorted(notebook for notebook, runs in self.runs_per_notebook.items() if len(runs) > 1)
+
+    def to_table(self) -> str:
+        table = []
+        for notebook in sorted(self.runs_per_notebook):
+            runs = self.runs_per_notebook[notebook]
+            table.append([notebook, sum(run.num_entries for run in runs), len(runs), '', '', ''])
+            for session_break in self.get_breaks(notebook):
+                table.append([
+                    '', '', '',
+                    f'{session_break.before.last_id}->{session_break.after.first_id}',
+                    session_break.num_skipped_entries,
+                    session_break.idle_ms,
+                ])
+        return tabulate(table, headers=['notebook', '# entries', '# runs', 'break (ids)', '# skipped entries', 'idle (ms)'])
+
+    def __str__(self):
+        return self.to_table()
+
+
+def detect_session_breaks(entries, notebooks=None, keep_entries=False) -> SessionBreakReport:
+    """
+    Single pass over the entries (ordered by id), grouping the entries of each notebook into runs of consecutive ids.
+    notebooks: only these notebooks are reported (all of them if None)
+    keep_entries: runs keep their entries, e.g. to be replayed independently (see `LogParser.split_sessions`)
+    """
+    runs_per_notebook = {}
+    for entry in entries:
+        if notebooks is not None and entry.notebook not in notebooks:
+            continue
+        runs = runs_per_notebook.setdefault(entry.notebook, [])
+        run = runs[-1] if runs else None
+        if run is not None and entry.id == run.last_entry.id + 1:
+            run.last_entry = entry
+            run.num_entries += 1
+            if keep_entries:
+                run.entries.append(entry)
+        else:
+            runs.append(LogRun(entry.notebook, entry, entries=[entry] if keep_entries else None))
+    return SessionBreakReport(runs_per_notebook)
@@ -0,0 +1,267 @@
+import os
+import sqlite3
+from array import array
+from typing import List
+from parsers.log_parser import LogParser, LogEntry, iter_log_entries
+from parsers.nb_parser import LRUCache
+
+# NOTE: bump whenever the schema (or how entries are ingested) changes, so that logs are ingested again
+LOG_DB_VERSION = 1
+
+_LOG_ENTRY_COLUMNS = (
+    'id', 'entry_type', 'subject', 'user', 'context', 'notebook', 'session_type', 'timestamp',
+    'timestamp_ms', 'content', 'cell_type'
+)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS log_files (
+    log_path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS log_entries (
+    log_path TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    entry_type TEXT,
+    subject TEXT,
+    user TEXT,
+    context TEXT,
+    notebook TEXT,
+    session_type TEXT,
+    timestamp TEXT,
+    timestamp_ms INTEGER,
+    content TEXT,
+    cell_type TEXT,
+    PRIMARY KEY (log_path, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS log_entries_notebook_id ON log_entries (notebook, id);
+CREATE INDEX IF NOT EXISTS log_entries_entry_type ON log_entries (entry_type);
+CREATE INDEX IF NOT EXISTS log_entries_timestamp_ms ON log_entries (timestamp_ms);
+'''
+
+
+def connect_log_db(db_filepath) -> sqlite3.Connection:
+    if os.path.dirname(db_filepath):
+        os.makedirs(os.path.dirname(db_filepath), exist_ok=True)
+    connection = sqlite3.connect(db_filepath)
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def ingest_log(connection, log_filepath, rebuild=False) -> bool:
+    """
+    Loads the entries of the log into the database, streamed (i.e. in bounded memory) in one transaction.
+    Returns whether the log was ingested, i.e. False if already ingested while unchanged (same size and mtime).
+    """
+    log_path = os.path.abspath(log_filepath)
+    stat = os.stat(log_filepath)
+    ingested = connection.execute('SELECT size, mtime_ns, version FROM log_files WHERE log_path = ?', (log_path,)).fetchone()
+    if not rebuild and ingested == (stat.st_size, stat.st_mtime_ns, LOG_DB_VERSION):
+        return False
+
+    def _rows():
+        for entry in iter_log_entries(log_filepath):
+            timestamp_ms = entry.timestamp_ms
+            yield (
+                log_path, entry.id, entry.entry_type, entry.subject, entry.user, entry.context, entry.notebook,
+                entry.session_type, entry.timestamp,
+                # NOTE: timestamps that could not be converted are kept as is, see `_convert_to_ms`
+                timestamp_ms if isinstance(timestamp_ms, int) else None,
+                entry.content, entry.cell_type
+            )
+
+    with connection:
+        connection.execute('DELETE FROM log_entries WHERE log_path = ?', (log_path,))
+        connection.executemany(
+            f'INSERT INTO log_entries (log_path, {", ".join(_LOG_ENTRY_COLUMNS)}) VALUES ({", ".join("?" * (len(_LOG_ENTRY_COLUMNS) + 1))})',
+            _rows()
+        )
+        connection.execute(
+            'INSERT OR REPLACE INTO log_files (log_path, size, mtime_ns, version) VALUES (?, ?, ?, ?)',
+            (log_path, stat.st_size, stat.st_mtime_ns, LOG_DB_VERSION)
+        )
+    return True
+
+
+def ingest_logs(db_filepath, log_filepaths, rebuild=False) -> List[str]:
+    # returns the logs (re)ingested, i.e. new or changed since last ingested
+    connection = connect_log_db(db_filepath)
+    try:
+        ingested_log_filepaths = [log_filepath for log_filepath in log_filepaths if ingest_log(connection, log_filepath, rebuild=rebuild)]
+        # NOTE: refreshes the statistics the query planner picks indexes with
+        connection.execute('PRAGMA optimize')
+        return ingested_log_filepaths
+    finally:
+        connection.close()
+
+
+def _row_to_entry(row) -> LogEntry:
+    entry_id, entry_type, subject, user, context, notebook, session_type, timestamp, timestamp_ms, content, cell_type = row
+    entry = LogEntry(entry_id, entry_type, subject, user, context, notebook, session_type, timestamp)
+    entry.set_content(content, cell_type)
+    if timestamp_ms is not None:
+        entry.timestamp_ms = timestamp_ms
+    return entry
+
+
+class SQLiteLogStore:
+    """
+    Entries of one ingested log (optionally of one notebook only), read from the database on demand.
+    Only their ids are kept in memory, entries are fetched by pages of `page_size` (the last `num_pages` are kept).
+    """
+    def __init__(self, db_filepath, log_filepath, notebook=None, page_size=256, num_pages=8):
+        self.db_filepath = db_filepath
+        self.log_path = os.path.abspath(log_filepath)
+        self.notebook = notebook
+        self.page_size = page_size
+        self.num_pages = num_pages
+        self._connection = None
+        self._ids = None
+        self._pages = LRUCache(num_pages)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # NOTE: opened lazily (e.g. once unpickled), read-only
+        if self._connection is None:
+            self._connection = sqlite3.connect(f'file:{os.path.abspath(self.db_filepath)}?mode=ro', uri=True)
+        return self._connection
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_pages'] = LRUCache(self.num_pages)
+        return state
+
+    def _where(self, **conditions):
+        # WHERE clause (and its parameters) of these entries, with the `field=value(s)` conditions on top
+        clauses, params = ['log_path = ?'], [self.log_path]
+        if self.notebook is not None:
+            clauses.append('notebook = ?')
+            params.append(self.notebook)
+        for field, value in conditions.items():
+            if field not in _LOG_ENTRY_COLUMNS:
+                raise ValueError(f'Unknown log entry field: {field}')
+            values = value if isinstance(value, list) else [value]
+            clauses.append(f'{field} IN ({", ".join("?" * len(values))})')
+            params.extend(values)
+        return ' AND '.join(clauses), params
+
+    def _select(self, where, params, order_by='id'):
+        return self.connection.execute(
+            f'SELECT {", ".join(_LOG_ENTRY_COLUMNS)} FROM log_entries WHERE {where} ORDER BY {order_by}', params
+        )
+
+    @property
+    def ids(self) -> array:
+        if self._ids is None:
+            where, params = self._where()
+            self._ids = array('q', (row[0] for row in self.connection.execute(f'SELECT id FROM log_entries WHERE {where} ORDER BY id', params)))
+        return self._ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _get_page(self, page_idx) -> List[LogEntry]:
+        def _fetch_page():
+            page_ids = self.ids[page_idx * self.page_size:(page_idx + 1) * self.page_size]
+            where, params = self._where()
+            return [
+                _row_to_entry(row)
+                for row in self._select(f'{where} AND id BETWEEN ? AND ?', params + [page_ids[0], page_ids[-1]])
+            ]
+        return self._pages.get_or_compute(page_idx, _fetch_page)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[entry_idx] for entry_idx in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f'Log entry index out of range: {idx}')
+        return self._get_page(idx // self.page_size)[idx % self.page_size]
+
+    def __iter__(self):
+        where, params = self._where()
+        for row in self._select(where, params):
+            yield _row_to_entry(row)
+
+    def to_entries(self) -> List[LogEntry]:
+        return list(self)
+
+    def get_entry_by_id(self, entry_id) -> LogEntry:
+        # NOTE: any entry of the whole log (e.g. neighbours of a notebook entries), None if there is no such entry
+        row = self._select('log_path = ? AND id = ?', [self.log_path, entry_id]).fetchone()
+        return None if row is None else _row_to_entry(row)
+
+    def query(self, start_ms=None, end_ms=None, **conditions) -> List[LogEntry]:
+        # entries with the `field=value(s)` conditions (as `LogParser.get_only`), within [start_ms, end_ms) if given
+        where, params = self._where(**conditions)
+        if start_ms is not None:
+            where, params = f'{where} AND timestamp_ms >= ?', params + [start_ms]
+        if end_ms is not None:
+            where, params = f'{where} AND timestamp_ms < ?', params + [end_ms]
+        return [_row_to_entry(row) for row in self._select(where, params)]
+
+    def get_unique(self, field) -> set:
+        where, params = self._where()
+        if field not in _LOG_ENTRY_COLUMNS:
+            raise ValueError(f'Unknown log entry field: {field}')
+        return {row[0] for row in self.connection.execute(f'SELECT DISTINCT {field} FROM log_entries WHERE {where}', params)}
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class SQLiteLogParser(LogParser):
+    """
+    `LogParser` over a log ingested into a SQLite database (see `ingest_logs`), in bounded memory:
+    entries are read from the database when indexed or iterated, and only materialized if `entries` is accessed.
+    `get_notebooks`, `divide_per_notebook` and `get_only` are answered by the database.
+    """
+    def __init__(self, db_filepath, log_filepath, notebook=None):
+        # NOTE: lazy, i.e. the log file itself is never read
+        super().__init__(log_filepath, lazy=True)
+        # NOTE: logs ingested into the database are not followed, see `refresh`
+        self._tail = None
+        self._store = SQLiteLogStore(db_filepath, log_filepath, notebook=notebook)
+
+    def parse(self):
+        self.entries = self._store.to_entries()
+        return self
+
+    def _get_store(self):
+        return self._store if self._entries is None else None
+
+    def iter_entries(self):
+        if self._entries is not None:
+            return iter(self._entries)
+        return iter(self._store)
+
+    def get_entry_by_id(self, entry_id) -> LogEntry:
+        return self._store.get_entry_by_id(entry_id)
+
+    def get_only(self, **kwargs):
+        if self._entries is not None:
+            return super().get_only(**kwargs)
+        return self._store.query(**kwargs)
+
+    def time_window(self, start_ms=None, end_ms=None, **kwargs) -> List[LogEntry]:
+        return self._store.query(start_ms=start_ms, end_ms=end_ms, **kwargs)
+
+    def get_notebooks(self):
+        if self._entries is not None:
+            return super().get_notebooks()
+        return self._store.get_unique('notebook')
+
+    def divide_per_notebook(self, notebooks_names=None):
+        if self._entries is not None:
+            return super().divide_per_notebook(notebooks_names)
+        if notebooks_names is None:
+            notebooks_names = sorted(self.get_notebooks())
+        return {
+            notebook: self.__class__(self._store.db_filepath, self.filepath, notebook=notebook)
+            for notebook in notebooks_names
+        }
@@ -1,112 +1,537 @@
+import io
+import os
+import re
+import sys
+import ast
 import json
+import mmap
+import atexit
+import bisect
+import shelve
+import hashlib
+import tokenize
+import astunparse
+from collections import OrderedDict
 from typing import List, Tuple
-from copy import deepcopy
+from copy import copy as shallow_copy
 from tabulate import tabulate
 from textwrap import wrap
+from parsers.compression import open_file, is_compressed, strip_compression_suffix
+
+# NOTE: bump whenever the output of `_reformat_code_lines_uncached` changes,
+# so that entries persisted on disk by older versions are not reused.
+REFORMAT_VERSION = 3
+
+
+def _normalize_content_lines(lines) -> Tuple[str, ...]:
+    # NOTE: unifies the encoding of notebook cells and logs contents before comparing
+    return tuple(
+        line.encode('ascii', 'backslashreplace').strip().decode().strip()
+        for line in lines
+    )
+
+
+def _hash_content(*objs) -> str:
+    raw = json.dumps(objs, sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+def _write_atomically(filepath, content, mode='w'):
+    # NOTE: readers never see a partially written file
+    if os.path.dirname(filepath):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_filepath = f'{filepath}.tmp{os.getpid()}'
+    try:
+        with open(tmp_filepath, mode) as f:
+            f.write(content)
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+
+
+class LRUCache:
+    """
+    Bounded LRU memo with hit/miss counters.
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute_fn):
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        self.misses += 1
+        value = compute_fn()
+        self._remember(key, value)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def info(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+
+class ReformatCache(LRUCache):
+    """
+    Bounded LRU memo of `_reformat_code_lines`, keyed by a content hash of the raw source lines.
+    Optionally backed by an on-disk `shelve` store that survives across runs.
+    """
+    def __init__(self, maxsize=4096, cache_filepath=None):
+        super().__init__(maxsize=maxsize)
+        self.disk_hits = 0
+        self._store = None
+        self._close_at_exit = False
+        self.cache_filepath = None
+        if cache_filepath is not None:
+            self.open_store(cache_filepath)
+
+    @staticmethod
+    def make_key(source) -> str:
+        return _hash_content(REFORMAT_VERSION, list(source))
+
+    def open_store(self, cache_filepath):
+        self.close()
+        if os.path.dirname(cache_filepath):
+            os.makedirs(os.path.dirname(cache_filepath), exist_ok=True)
+        self._store = shelve.open(cache_filepath)
+        self.cache_filepath = cache_filepath
+        # NOTE: registered once, closes whichever store is open at exit
+        if not self._close_at_exit:
+            atexit.register(self.close)
+            self._close_at_exit = True
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def get(self, source) -> List[str]:
+        key = self.make_key(source)
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return list(self._entries[key])
+
+        if self._store is not None and key in self._store:
+            self.disk_hits += 1
+            value = self._store[key]
+            self._remember(key, value)
+            return list(value)
+
+        self.misses += 1
+        value = tuple(_reformat_code_lines_uncached(source))
+        self._remember(key, value)
+        if self._store is not None:
+            self._store[key] = value
+        return list(value)
+
+    def clear(self):
+        super().clear()
+        self.disk_hits = 0
+
+    def info(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            **super().info(),
+            'disk_hits': self.disk_hits,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'cache_filepath': self.cache_filepath,
+        }
+
+
+REFORMAT_CACHE = ReformatCache()
+
+
+def configure_reformat_cache(maxsize=None, cache_filepath=None) -> ReformatCache:
+    if maxsize is not None:
+        REFORMAT_CACHE.maxsize = maxsize
+        while len(REFORMAT_CACHE._entries) > maxsize:
+            REFORMAT_CACHE._entries.popitem(last=False)
+    if cache_filepath is not None:
+        REFORMAT_CACHE.open_store(cache_filepath)
+    return REFORMAT_CACHE
+
+
+# NOTE: rendered (tokenized) cells, keyed by cell fingerprint and render mode
+RENDER_CACHE = LRUCache(maxsize=4096)
+
 
 def _reformat_code_lines(_source):
-    if len(_source) == 0:
-        return []
-    source = [
-        line
-        # line.rstrip() # remove trailing whitespace
-        for line in _source
-        if line.strip() # keep only non-empty lines
+    return REFORMAT_CACHE.get(_source)
+
+
+class _ChunksWriter:
+    def __init__(self):
+        self.chunks = []
+        self.write = self.chunks.append
+
+    def flush(self):
+        pass
+
+
+class _LineTrackingUnparser(astunparse.Unparser):
+    """
+    Records `anchors` as (source_lineno, num_written_chunks) pairs, meaning that the source up to
+    `source_lineno` has been unparsed into the first `num_written_chunks` chunks, in non-decreasing
+    order: once per decorator, once per block header (e.g. `if ...:`, `elif ...:`, `else:`, `finally:`)
+    and once per statement end.
+    """
+    def __init__(self, tree, file, code_lines):
+        self.anchors = []
+        self._code_lines = code_lines
+        self._nodes = []
+        # NOTE: per statement being unparsed, line numbers of its headers not entered yet
+        self._headers = {}
+        # NOTE: end line numbers of the decorators not unparsed yet, by node id
+        self._decorators = {}
+        super().__init__(tree, file=file)
+
+    def dispatch(self, tree):
+        # NOTE: same as `astunparse.Unparser.dispatch`, inlined as it is called for every node
+        if isinstance(tree, list):
+            for t in tree:
+                self.dispatch(t)
+            return
+        meth = getattr(self, "_"+tree.__class__.__name__)
+        if not isinstance(tree, (ast.stmt, ast.excepthandler)):
+            meth(tree)
+            if self._decorators and id(tree) in self._decorators:
+                self.anchors.append((self._decorators.pop(id(tree)), len(self.f.chunks)))
+            return
+        decorator_list = getattr(tree, 'decorator_list', None)
+        if decorator_list:
+            self._decorators.update((id(decorator), decorator.end_lineno) for decorator in decorator_list)
+        self._nodes.append(tree)
+        meth(tree)
+        self._nodes.pop()
+        self._headers.pop(id(tree), None)
+        self.anchors.append((tree.end_lineno, len(self.f.chunks)))
+
+    def enter(self):
+        super().enter()
+        if not self._nodes:
+            return
+        node = self._nodes[-1]
+        headers = self._headers.get(id(node))
+        if headers is None:
+            # NOTE: first header of the statement, e.g. `if ...:`, the other ones are entered in order afterwards
+            self._headers[id(node)] = iter(self._get_next_headers(node))
+            self.anchors.append((node.lineno, len(self.f.chunks)))
+        else:
+            lineno = next(headers, None)
+            if lineno is not None:
+                self.anchors.append((lineno, len(self.f.chunks)))
+
+    def _find_header(self, prev_end_lineno, block):
+        # NOTE: between two blocks there are only empty lines, comments and the header of the second block
+        for lineno in range(prev_end_lineno + 1, block[0].lineno + 1):
+            line = self._code_lines[lineno - 1].strip()
+            if line and not line.startswith('#'):
+                return lineno
+        return block[0].lineno
+
+    def _get_next_headers(self, node) -> List[int]:
+        # line numbers of the headers after the first one, in the order they are unparsed (see `_If`, `_Try`, ...)
+        headers = []
+        if isinstance(node, ast.If):
+            # NOTE: nested ifs are collapsed into elifs, whose header is the nested if
+            while len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If):
+                node = node.orelse[0]
+                headers.append(node.lineno)
+            if node.orelse:
+                headers.append(self._find_header(node.body[-1].end_lineno, node.orelse))
+        elif isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+            if node.orelse:
+                headers.append(self._find_header(node.body[-1].end_lineno, node.orelse))
+        elif isinstance(node, ast.Try):
+            prev_end_lineno = (node.handlers or node.body)[-1].end_lineno
+            for block in (node.orelse, node.finalbody):
+                if block:
+                    headers.append(self._find_header(prev_end_lineno, block))
+                    prev_end_lineno = block[-1].end_lineno
+        return headers
+
+
+def _get_comment_lines(code, code_lines):
+    # own-line comments (starting at first column) as (lineno, comment)
+    if '"""' not in code and "'''" not in code:
+        # NOTE: without multi-line strings, no line starting with '#' can be anything but a comment
+        return [
+            (lineno, line)
+            for lineno, line in enumerate(code_lines, 1)
+            if line.startswith('#')
+        ]
+    return [
+        (token.start[0], token.string)
+        for token in tokenize.generate_tokens(io.StringIO(code).readline)
+        if token.type == tokenize.COMMENT and token.start[1] == 0
     ]
-    comment_lines = []
-    comment_following_lines = []
-    for i, line in enumerate(source):
-        if line.startswith('#'):
-            prev_line = None if i == 0 else source[i-1]
-            comment_lines.append(line)
-            comment_following_lines.append(prev_line)
-
-    code = '\n'.join(list(map(str.rstrip, _source)))
-
-    def _parse_code(code):
-        # import black
-        # mode=black.Mode()
-        # longest_line_in_code = max([len(line)*2 for line in code.split('\n')])
-        # mode.line_length = longest_line_in_code
-        # formatted_code = black.format_str(code, mode=mode)
-        # return formatted_code
-
-        # Parse the code into an Abstract Syntax Tree (AST)
-        import ast
-        import astunparse
-        tree = ast.parse(code, type_comments=True)
-
-        # Unparse the AST back into code
-        formatted_code = astunparse.unparse(tree)
-
-        code = formatted_code.strip()
-        return code
-
-
-    new_source = _parse_code(code).split('\n')
-
-    # drop comments that were kept by the parser from the leftover comments
-    kept_comments = []
-    kept_following_lines = []
-    for comment, following_line in zip(comment_lines, comment_following_lines):
-        if comment.strip() not in new_source:
-            kept_comments.append(comment)
-            kept_following_lines.append(following_line)
-    comment_lines = kept_comments
 
-    new_source = [line.rstrip() for line in new_source if line.strip()]
 
-    _comment_following_lines = comment_following_lines
-    comment_following_lines = []
-    for line in _comment_following_lines:
-        if line:
-            line = line.strip()
-            try:
-                _line = _parse_code(line)
-                if _line:
-                    line = _line
-            except Exception:
-                pass
-
-        comment_following_lines.append(line)
-    del _comment_following_lines
-
-    # verification step
-    for line in comment_following_lines:
-        if line == '':
-            raise ValueError('Comment following line is empty and not None!')
-
-
-    # add back the comments
-    for comment, following_line in zip(comment_lines, comment_following_lines):
-        if following_line:
-            # new_source.insert(code_lines.index(following_line) + 1, comment)
-            for i, line in enumerate(new_source):
-                if line.rstrip().endswith(following_line.strip()):
-                    new_source.insert(i + 1, comment)
-                    break
-            else:
-                breakpoint()
-                raise ValueError(f'Could not find the following line: {following_line}')
-        else:
-            new_source.insert(0, comment)
+def _reformat_code_lines_uncached(_source):
+    if len(_source) == 0:
+        return []
+    code_lines = list(map(str.rstrip, _source))
+    code = '\n'.join(code_lines)
+
+    # Parse the code into an Abstract Syntax Tree (AST) and unparse it back into code
+    tree = ast.parse(code, type_comments=True)
+    writer = _ChunksWriter()
+    unparser = _LineTrackingUnparser(tree, writer, code_lines)
+    comment_lines = _get_comment_lines(code, code_lines)
+    if not comment_lines:
+        return [line.rstrip() for line in ''.join(writer.chunks).split('\n') if line.strip()]
+
+    # comments are lost by the parser; put each of them back right after
+    # the unparsed code of what precedes it in the source (in a single pass)
+    new_source = []
+    anchors = iter(unparser.anchors)
+    anchor = next(anchors, None)
+    num_placed_chunks = 0
+    pending = []
+    for lineno, comment in comment_lines:
+        while anchor is not None and anchor[0] < lineno:
+            pending += writer.chunks[num_placed_chunks:anchor[1]]
+            num_placed_chunks = anchor[1]
+            anchor = next(anchors, None)
+        new_source += ''.join(pending).split('\n')
+        new_source.append(comment)
+        pending = []
+    new_source += ''.join(pending + writer.chunks[num_placed_chunks:]).split('\n')
 
     new_source = [line.rstrip() for line in new_source if line.strip()]
     return new_source
 
 
+def _reformat_source(cell_type, _source):
+    if cell_type == 'code':
+        return _reformat_code_lines(_source)
+    # NOTE: markdown and raw cells are not python, hence no AST work; only drop empty lines and trailing whitespace
+    return [line.rstrip() for line in _source if line.strip()]
+
+
+class LazyJSONValue:
+    """
+    Reference to a JSON value by its byte offsets in a file, only loaded when asked for.
+    `digest` is the `_json_digest` of the value, computed from its bytes while scanning the file.
+    """
+    __slots__ = ('filepath', 'start', 'end', 'digest')
+
+    def __init__(self, filepath, start, end, digest=None):
+        self.filepath = filepath
+        self.start = start
+        self.end = end
+        self.digest = digest
+
+    def load(self):
+        with open(self.filepath, 'rb') as f:
+            f.seek(self.start)
+            return json.loads(f.read(self.end - self.start))
+
+    def is_empty(self) -> bool:
+        # NOTE: whether the value is an empty array or object, only reading up to its first element
+        with open(self.filepath, 'rb') as f:
+            f.seek(self.start)
+            if f.read(1) not in (b'[', b'{'):
+                return False
+            chunk = f.read(64).lstrip()
+            while not chunk and f.tell() < self.end:
+                chunk = f.read(64).lstrip()
+            return chunk[:1] in (b']', b'}')
+
+    def __str__(self):
+        return f'LazyJSONValue({self.filepath}, {self.start}, {self.end})'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def _load_lazily(value):
+    return value.load() if isinstance(value, LazyJSONValue) else value
+
+
+def _json_digest(value) -> str:
+    # digest of the serialization of a JSON value without indentation, see `_digest_json_span`
+    if isinstance(value, LazyJSONValue):
+        return value.digest
+    raw = json.dumps(value, separators=(',', ': '), ensure_ascii=False)
+    return hashlib.blake2b(raw.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+def _has_value(value) -> bool:
+    # same as `bool(_load_lazily(value))` for arrays and objects, without loading them
+    return not value.is_empty() if isinstance(value, LazyJSONValue) else bool(value)
+
+
+_JSON_WS = re.compile(rb'[ \t\n\r]*')
+_JSON_SCALAR_END = re.compile(rb'[,\]}\s]')
+_JSON_STRUCTURAL = re.compile(rb'["\[\]{}]')
+
+# cells values that are only referenced by offsets, not loaded
+LAZY_CELL_KEYS = ('outputs', 'metadata', 'attachments')
+
+
+def _skip_ws(buf, idx):
+    return _JSON_WS.match(buf, idx).end()
+
+
+def _expect(buf, idx, char):
+    idx = _skip_ws(buf, idx)
+    if buf[idx:idx+1] != char:
+        raise ValueError(f'Expected {char} at byte {idx}, got {buf[idx:idx+1]}')
+    return idx + 1
+
+
+def _skip_json_string(buf, idx):
+    # NOTE: memchr-based `find` is way faster than a regex over long strings (e.g. base64 images)
+    end = buf.find(b'"', idx + 1)
+    while end >= 0:
+        num_backslashes = 0
+        while buf[end - 1 - num_backslashes] == 0x5c: # i.e., escaped by a preceding backslash
+            num_backslashes += 1
+        if num_backslashes % 2 == 0:
+            return end + 1
+        end = buf.find(b'"', end + 1)
+    raise ValueError(f'Unterminated JSON string at byte {idx}')
+
+
+def _skip_json_value(buf, idx):
+    # returns the end offset of the JSON value starting at idx without decoding it
+    char = buf[idx:idx+1]
+    if char == b'"':
+        return _skip_json_string(buf, idx)
+    if char not in (b'[', b'{'):
+        match = _JSON_SCALAR_END.search(buf, idx)
+        return match.start() if match else len(buf)
+    depth = 0
+    while True:
+        match = _JSON_STRUCTURAL.search(buf, idx)
+        if match is None:
+            raise ValueError(f'Unterminated JSON value at byte {idx}')
+        if match.group() == b'"':
+            idx = _skip_json_string(buf, match.start())
+            continue
+        depth += 1 if match.group() in (b'[', b'{') else -1
+        idx = match.end()
+        if depth == 0:
+            return idx
+
+
+def _digest_json_span(buf, start, end) -> str:
+    """
+    `_json_digest` of the JSON value at buf[start:end] without decoding it, i.e. of its bytes without indentation.
+    Same as the digest of the loaded value for files written by `json.dump(..., indent=..., ensure_ascii=False)`
+    (e.g. by nbformat), otherwise only independent of where the value is in the file.
+    """
+    # NOTE: newlines (and carriage returns) cannot be raw within JSON strings, hence only belong to the indentation
+    span = buf[start:end]
+    if b'\r' in span:
+        span = span.translate(None, b'\r')
+    unindented = b''.join([line.lstrip(b' \t') for line in span.split(b'\n')])
+    return hashlib.blake2b(unindented, digest_size=16).hexdigest()
+
+
+def _load_json_value(buf, key, idx):
+    end = _skip_json_value(buf, idx)
+    return json.loads(buf[idx:end]), end
+
+
+def _scan_json_object(buf, idx, scan_value=_load_json_value):
+    # scan_value(buf, key, value_start) -> (value, value_end)
+    obj = {}
+    idx = _skip_ws(buf, _expect(buf, idx, b'{'))
+    if buf[idx:idx+1] == b'}':
+        return obj, idx + 1
+    while True:
+        key_end = _skip_json_string(buf, idx)
+        key = json.loads(buf[idx:key_end])
+        idx = _skip_ws(buf, _expect(buf, key_end, b':'))
+        obj[key], idx = scan_value(buf, key, idx)
+        idx = _skip_ws(buf, idx)
+        if buf[idx:idx+1] == b'}':
+            return obj, idx + 1
+        idx = _skip_ws(buf, _expect(buf, idx, b','))
+
+
+def _scan_json_array(buf, idx, scan_item):
+    # scan_item(buf, item_start) -> (item, item_end)
+    items = []
+    idx = _skip_ws(buf, _expect(buf, idx, b'['))
+    if buf[idx:idx+1] == b']':
+        return items, idx + 1
+    while True:
+        item, idx = scan_item(buf, idx)
+        items.append(item)
+        idx = _skip_ws(buf, idx)
+        if buf[idx:idx+1] == b']':
+            return items, idx + 1
+        idx = _skip_ws(buf, _expect(buf, idx, b','))
+
+
+def _load_notebook_without_outputs(notebook_filepath) -> dict:
+    """
+    Loads the notebook by scanning the memory-mapped file, keeping all the top-level fields and each cell
+    but its `LAZY_CELL_KEYS` values, which are kept as `LazyJSONValue` references instead.
+    """
+    def _scan_cell_value(buf, key, idx):
+        if key in LAZY_CELL_KEYS:
+            end = _skip_json_value(buf, idx)
+            return LazyJSONValue(notebook_filepath, idx, end, digest=_digest_json_span(buf, idx, end)), end
+        return _load_json_value(buf, key, idx)
+
+    def _scan_notebook_value(buf, key, idx):
+        if key == 'cells':
+            return _scan_json_array(buf, idx, lambda buf, idx: _scan_json_object(buf, idx, _scan_cell_value))
+        return _load_json_value(buf, key, idx)
+
+    with open(notebook_filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        json_data, _ = _scan_json_object(buf, 0, _scan_notebook_value)
+    return json_data
+
+
 class CellEntry:
+    __slots__ = (
+        'cell_type', 'cell_id', '_source', '_tokenized_source', 'execution_count', '_outputs', '_metadata',
+        '_fingerprint', '_extras_fingerprint', '_content_key'
+    )
+
     def __init__(self, cell_type, cell_id, source, execution_count=None, outputs=None, metadata=None):
-        self.cell_type = cell_type
+        self.cell_type = sys.intern(cell_type) if isinstance(cell_type, str) else cell_type
         self.cell_id = cell_id
         self._source = source
-        self._tokenized_source = _reformat_code_lines(source)
+        self._tokenized_source = None # NOTE: computed lazily on first access
         self.execution_count = execution_count
-        self.outputs = outputs
-        self.metadata = metadata
+        self._outputs = outputs # NOTE: either loaded or a `LazyJSONValue`
+        self._metadata = metadata
+        self._fingerprint = None
+        self._extras_fingerprint = None
+        self._content_key = None
 
     @property
     def source(self):
+        if self._tokenized_source is None:
+            self._tokenized_source = _reformat_source(self.cell_type, self._source)
         return self._tokenized_source
 
     @source.setter
@@ -114,7 +539,45 @@ class CellEntry:
         if not isinstance(v, list):
             raise ValueError(f'Expected list, got {type(v)}')
         self._source = v
-        self._tokenized_source = _reformat_code_lines(v)
+        self._tokenized_source = None
+        self._fingerprint = None
+        self._content_key = None
+
+    @property
+    def content_key(self) -> Tuple[str, ...]:
+        # normalized tokenized source used to match cells against logs contents
+        if self._content_key is None:
+            self._content_key = _normalize_content_lines(self.source)
+        return self._content_key
+
+    @property
+    def outputs(self):
+        return _load_lazily(self._outputs)
+
+    @property
+    def metadata(self):
+        return _load_lazily(self._metadata)
+
+    @property
+    def fingerprint(self) -> str:
+        # NOTE: ignores _source as long as the tokenized source is the same
+        if self._fingerprint is None:
+            if self._extras_fingerprint is None:
+                # outputs and metadata are shared with the entries derived by `replace_source`
+                # NOTE: lazily loaded values are hashed by their bytes digests, i.e. without being loaded
+                self._extras_fingerprint = _hash_content(
+                    self.execution_count, _json_digest(self._outputs), _json_digest(self._metadata)
+                )
+            self._fingerprint = _hash_content(
+                self.cell_type, self.cell_id, self.source, self._extras_fingerprint
+            )
+        return self._fingerprint
+
+    def replace_source(self, source) -> 'CellEntry':
+        # new entry sharing everything else (outputs, metadata, ..) with this one
+        new_cell = shallow_copy(self)
+        new_cell.source = source
+        return new_cell
 
     def __str__(self):
         return json.dumps({
@@ -154,16 +617,22 @@ class CellEntry:
         else:
             return tabulate(table, tablefmt="fancy_grid", colalign=("right", "left"), stralign="center", numalign="center")
 
-    def get_json(self, compact=True, tokenize=True):
-        if tokenize:
-            source = self._tokenized_source
+    def _render(self, render_fn, mode, compact, tokenize):
+        # NOTE: the fingerprint only covers the tokenized source, raw renders are not cached;
+        # compact renders do not read outputs and metadata, hence are keyed without them
+        if not tokenize:
+            return render_fn(compact, tokenize)
+        if compact:
+            key = (self.cell_type, self.cell_id, tuple(self.source), mode)
         else:
-            source = self._source
+            key = (self.fingerprint, mode, compact)
+        return RENDER_CACHE.get_or_compute(key, lambda: render_fn(compact, tokenize))
 
+    def _render_json(self, compact, tokenize):
         json_data = {
             'cell_type': self.cell_type,
             'id': self.cell_id,
-            'source': source
+            'source': self.source if tokenize else self._source
         }
 
         if not compact:
@@ -175,54 +644,95 @@ class CellEntry:
                 json_data['metadata'] = self.metadata
         return json_data
 
-    def get_xml(self, compact=True, tokenize=True):
-        if tokenize:
-            source = self._tokenized_source
-        else:
-            source = self._source
-
-        xml_data = f'<cell>\n'
-        xml_data += f'<cell_type>{self.cell_type}</cell_type>\n'
-        xml_data += f'<id>{self.cell_id}</id>\n'
-        xml_data += f'<source>\n'
-        for line in source:
-            xml_data += f'{line}\n'
-        xml_data += f'</source>\n'
+    def _render_json_str(self, compact, tokenize):
+        # indented as an item of the `NotebookParser.__str__` list
+        return '    ' + json.dumps(self._render(self._render_json, 'json', compact, tokenize), indent=4).replace('\n', '\n    ')
+
+    def _render_xml(self, compact, tokenize):
+        xml_data = [
+            '<cell>',
+            f'<cell_type>{self.cell_type}</cell_type>',
+            f'<id>{self.cell_id}</id>',
+            '<source>',
+            *(self.source if tokenize else self._source),
+            '</source>',
+        ]
         if not compact:
             if self.execution_count:
-                xml_data += f'<execution_count>{self.execution_count}</execution_count>\n'
+                xml_data.append(f'<execution_count>{self.execution_count}</execution_count>')
             if self.outputs:
-                xml_data += f'<outputs>{self.outputs}</outputs>\n'
+                xml_data.append(f'<outputs>{self.outputs}</outputs>')
             if self.metadata:
-                xml_data += f'<metadata>{self.metadata}</metadata>\n'
-        xml_data += f'</cell>\n'
-        return xml_data
+                xml_data.append(f'<metadata>{self.metadata}</metadata>')
+        xml_data.append('</cell>\n')
+        return '\n'.join(xml_data)
+
+    def get_json(self, compact=True, tokenize=True):
+        # NOTE: shallow copy, callers are free to update the returned dict
+        return dict(self._render(self._render_json, 'json', compact, tokenize))
+
+    def get_json_str(self, compact=True, tokenize=True):
+        return self._render(self._render_json_str, 'json_str', compact, tokenize)
+
+    def get_xml(self, compact=True, tokenize=True):
+        return self._render(self._render_xml, 'xml', compact, tokenize)
+
+    def get_notebook_json(self, org_cell) -> dict:
+        # cell as exported by `NotebookParser.to_notebook`, outputs of code cells are dropped without being loaded
+        # NOTE: keys in the same order as the notebooks written so far, i.e. as `get_json(compact=False)` then cleared
+        json_data = {
+            'cell_type': self.cell_type,
+            'id': self.cell_id,
+            'source': self.source,
+        }
+        if self.execution_count:
+            json_data['execution_count'] = self.execution_count
+        if self.cell_type == 'code':
+            json_data['id'] = org_cell['id']
+            if _has_value(self._outputs):
+                # NOTE: the cleared outputs keep their place, before the metadata
+                json_data['outputs'] = []
+                json_data['metadata'] = {}
+            else:
+                json_data['metadata'] = {}
+                json_data['outputs'] = []
+        elif self.cell_type == 'markdown':
+            if self.outputs:
+                json_data['outputs'] = self.outputs
+            json_data['metadata'] = {}
+        else:
+            raise ValueError(f'Unknown cell type: {self.cell_type}')
+        return json_data
 
     def __eq__(self, other):
         if isinstance(other, CellEntry):
-            for key in self.__dict__.keys():
-                # ignore _source that as long as the tokenized source is the same
-                if self.__dict__[key] != other.__dict__[key] and key != '_source':
-                    return False
-                if self.source != other.source:
-                    return False
-            return True
+            return self is other or self.fingerprint == other.fingerprint
         else:
             return False
 
 
 
 class NotebookParser:
-    def __init__(self, notebook_filepath):
+    def __init__(self, notebook_filepath, lazy_outputs=False):
+        # lazy_outputs: cells outputs and metadata are not loaded, only referenced (see `LazyJSONValue`);
+        # NOTE: compressed notebooks (e.g. `.ipynb.gz`) are decompressed on the fly, hence always loaded at once
         self.filepath = notebook_filepath
-        with open(self.filepath) as f:
-            self.json_data = json.load(f)
+        if lazy_outputs and not is_compressed(self.filepath):
+            self.json_data = _load_notebook_without_outputs(self.filepath)
+        else:
+            with open_file(self.filepath) as f:
+                self.json_data = json.load(f)
         self.parse()
 
     def __str__(self):
-        return json.dumps(
-            self.get_cells(json=True, compact=True), indent=4
-        )
+        # NOTE: same as `json.dumps(self.get_cells(json=True, compact=True), indent=4)`,
+        # composed from the cached renders of the cells
+        if not self.cell_entries:
+            return '[]'
+        return '[\n' + ',\n'.join(cell.get_json_str(compact=True) for cell in self.cell_entries) + '\n]'
+
+    def get_xml(self, compact=True, tokenize=True) -> str:
+        return ''.join(cell.get_xml(compact=compact, tokenize=tokenize) for cell in self.cell_entries)
 
     def tabulate(self, text_width=100) -> str:
         table = []
@@ -232,11 +742,21 @@ class NotebookParser:
         nb_json = tabulate(table, tablefmt="fancy_grid", colalign=("right", "left"), stralign="center", numalign="center")
         return f'Notebook: {self.filepath}\n{nb_json}'
 
+    @property
+    def root_hash(self) -> str:
+        # Merkle-style hash over the cells fingerprints, cached until the cells change
+        if self._root_hash is None:
+            self._root_hash = _hash_content([cell.fingerprint for cell in self.cell_entries])
+        return self._root_hash
+
     def get_diff(self, other) -> List[Tuple[CellEntry, CellEntry]]:
         # get the differing cells entries
+        if len(self) == len(other) and self.root_hash == other.root_hash:
+            return []
         diff_cells = []
         for cell, other_cell in zip(self.cell_entries, other.cell_entries):
-            if cell != other_cell:
+            # NOTE: cells shared between copy-on-write states are skipped without hashing
+            if cell is not other_cell and cell.fingerprint != other_cell.fingerprint:
                 diff_cells.append((cell, other_cell))
         return diff_cells
 
@@ -247,18 +767,61 @@ class NotebookParser:
     def __repr__(self):
         return self.__str__()
 
+    def _copy(self) -> 'NotebookParser':
+        # NOTE: copy-on-write; the new state shares `json_data` and all the untouched
+        # `CellEntry` objects with this one, only the cells list itself is new.
+        _self = self.__class__.__new__(self.__class__)
+        _self.__dict__.update(self.__dict__)
+        _self.cell_entries = list(self.cell_entries)
+        return _self
+
+    def _invalidate(self, content_index=True):
+        self._root_hash = None
+        if content_index:
+            self._content_index = None
+
+    def _place_cells(self, new_cells):
+        # the content index (if built) is updated copy-on-write as well, as it might be shared with other states
+        content_index = None if self._content_index is None else dict(self._content_index)
+        for cell_idx, cell in new_cells:
+            if content_index is not None:
+                old_key = self.cell_entries[cell_idx].content_key
+                content_index[old_key] = [idx for idx in content_index[old_key] if idx != cell_idx]
+                if not content_index[old_key]:
+                    del content_index[old_key]
+                new_idxs = list(content_index.get(cell.content_key, []))
+                bisect.insort(new_idxs, cell_idx)
+                content_index[cell.content_key] = new_idxs
+            self.cell_entries[cell_idx] = cell
+        self._invalidate(content_index=False)
+        self._content_index = content_index
+
+    def _set_cell_source(self, cell_id, source):
+        # never mutate a cell in place as it might be shared with other states
+        self._place_cells([(cell_id, self.cell_entries[cell_id].replace_source(source))])
+
+    def replace_cells(self, new_cells, copy=True) -> 'NotebookParser':
+        # new_cells: iterable of (cell_idx, CellEntry) placed as is (i.e., shared) in the new state
+        if copy:
+            _self = self._copy()
+        else:
+            _self = self
+        _self._place_cells(new_cells)
+        return _self
+
     def drop_cell(self, cell, copy=True) -> 'NotebookParser':
         # remove first occurance of cell
         if copy:
-            _self = deepcopy(self)
+            _self = self._copy()
         else:
             _self = self
         _self.cell_entries.remove(cell)
+        _self._invalidate()
         return _self
 
     def drop_code(self, cell: CellEntry, copy: bool=True) -> 'NotebookParser':
         if copy:
-            _self = deepcopy(self)
+            _self = self._copy()
         else:
             _self = self
         for i, line in enumerate(cell.source):
@@ -266,34 +829,34 @@ class NotebookParser:
                 continue
             else:
                 assert _self.cell_entries[cell.cell_id] == cell
-                _self.cell_entries[cell.cell_id].source = cell.source[:i]
+                _self._set_cell_source(cell.cell_id, cell.source[:i])
                 break
         return _self
 
     def drop_content(self, cell: CellEntry, copy: bool=True) -> 'NotebookParser':
         if copy:
-            _self = deepcopy(self)
+            _self = self._copy()
         else:
             _self = self
         # TODO ensure that the content is the same
         if _self.cell_entries[cell.cell_id].source != cell.source:
             breakpoint()
             raise ValueError('Content is not the same')
-        _self.cell_entries[cell.cell_id].source = []
+        _self._set_cell_source(cell.cell_id, [])
         return _self
 
     def replace_cell_content(self, cell, log_content, copy=True) -> 'NotebookParser':
         if copy:
-            _self = deepcopy(self)
+            _self = self._copy()
         else:
             _self = self
 
-        _self.cell_entries[cell.cell_id].source = log_content.split('\\n')
+        _self._set_cell_source(cell.cell_id, log_content.split('\\n'))
         return _self
 
     def apply_log_entry(self, cell_id, log_entry, copy=True) -> 'NotebookParser':
         if copy:
-            _self = deepcopy(self)
+            _self = self._copy()
         else:
             _self = self
         if log_entry.content is None: # NULL log entry
@@ -302,7 +865,7 @@ class NotebookParser:
         if not log_entry.content:
             raise ValueError('Log entry content is empty')
 
-        _self.cell_entries[cell_id].source = log_entry.content.split('\n')
+        _self._set_cell_source(cell_id, log_entry.content.split('\n'))
 
         # if _self.cell_entries[cell_id].source == ['']:
         #     breakpoint()
@@ -325,34 +888,20 @@ class NotebookParser:
 
         return _self
 
+    def _get_content_index(self):
+        # normalized cell content -> cells indices (top to bottom)
+        if self._content_index is None:
+            content_index = {}
+            for cell_idx, cell in enumerate(self.cell_entries):
+                content_index.setdefault(cell.content_key, []).append(cell_idx)
+            self._content_index = content_index
+        return self._content_index
+
     def find_cell_by_content(self, content, start_from_top=True) -> CellEntry:
-        def _unify_encoding(*strs, encoding='ascii', errors='backslashreplace'):
-            # import chardet
-            # def _process_str(_s):
-            #     # orig_encoding = chardet.detect(_s.encode())['encoding']
-            #     # return _s.encode(orig_encoding).decode(encoding, errors).encode(encoding).decode(encoding)
-            #     return _s.encode('ascii', 'backslashreplace').strip().decode()
-            return [
-                _s.encode('ascii', 'backslashreplace').strip().decode()
-                for _s in strs
-            ]
-        _iterator = self.cell_entries if start_from_top else reversed(self.cell_entries)
-        for cell in _iterator:
-            equal=True
-            t1 = cell.source
-            t2 = content.split('\\n')
-            if len(t1) != len(t2):
-                continue
-            t1 = map(str.strip, _unify_encoding(*t1))
-            t2 = map(str.strip, _unify_encoding(*t2))
-            for l1, l2 in zip(t1, t2):
-                if l1 != l2:
-                    equal=False
-                    # breakpoint()
-                    break
-            if equal:
-                return cell
-        return None
+        cell_idxs = self._get_content_index().get(_normalize_content_lines(content.split('\\n')))
+        if not cell_idxs:
+            return None
+        return self.cell_entries[cell_idxs[0] if start_from_top else cell_idxs[-1]]
 
     def get_cells(self, json=True, compact=True) -> List[CellEntry]:
         if json:
@@ -376,6 +925,7 @@ class NotebookParser:
             metadata = cell.get('metadata')
             cell_entry = CellEntry(cell_type, cell_id, source, executation_count, outputs, metadata)
             self.cell_entries.append(cell_entry)
+        self._invalidate()
         return self
 
     def __len__(self):
@@ -387,34 +937,54 @@ class NotebookParser:
     def __iter__(self):
         return iter(self.cell_entries)
 
-    def to_notebook(self, directory='__nb_states', filepath_postfix='_modified') -> str:
-        cells = self.get_cells(json=True, compact=False)
-        for cell, org_cell in zip(cells, self.json_data['cells']):
-            if cell['cell_type'] == 'code':
-                cell['metadata'] = {}
-                cell['outputs'] = []
-                cell['id'] = org_cell['id']
-            elif cell['cell_type'] == 'markdown':
-                cell['metadata'] = {}
-            else:
-                raise ValueError(f'Unknown cell type: {cell["cell_type"]}')
-
-        update_json = {
-            'cells': cells,
+    def to_notebook_json(self) -> dict:
+        return {
+            'cells': [
+                cell.get_notebook_json(org_cell)
+                for cell, org_cell in zip(self.cell_entries, self.json_data['cells'])
+            ],
             'metadata': self.json_data['metadata'],
             'nbformat': self.json_data['nbformat'],
             'nbformat_minor': self.json_data['nbformat_minor']
         }
 
-        new_filepath = self.filepath.replace('.ipynb', f'{filepath_postfix}.ipynb')
-        import os
+    def to_notebook_str(self, indent=None, rendered_cells=None) -> str:
+        """
+        Serialized notebook, compact unless `indent` is given.
+        rendered_cells: memo of the compact serialized cells, to be shared across the (copy-on-write) states
+        of a session so that each cell is serialized once no matter in how many states it appears.
+        """
+        if indent is not None:
+            return json.dumps(self.to_notebook_json(), indent=indent)
+
+        if rendered_cells is None:
+            rendered_cells = {}
+        cells_strs = []
+        for cell_idx, (cell, org_cell) in enumerate(zip(self.cell_entries, self.json_data['cells'])):
+            # NOTE: the cell is kept along its render so that its id() is not reused
+            _, cell_str = rendered_cells.get((id(cell), cell_idx), (None, None))
+            if cell_str is None:
+                cell_str = json.dumps(cell.get_notebook_json(org_cell), separators=(',', ':'))
+                rendered_cells[(id(cell), cell_idx)] = (cell, cell_str)
+            cells_strs.append(cell_str)
+        # NOTE: 'cells' comes first, the rest of the fields follow (as in `to_notebook_json`)
+        nb_fields_str = json.dumps({
+            'metadata': self.json_data['metadata'],
+            'nbformat': self.json_data['nbformat'],
+            'nbformat_minor': self.json_data['nbformat_minor']
+        }, separators=(',', ':'))
+        return '{"cells":[' + ','.join(cells_strs) + '],' + nb_fields_str[1:]
+
+    def get_notebook_filepath(self, directory='__nb_states', filepath_postfix='_modified') -> str:
+        # NOTE: states are written uncompressed, whatever the notebook they come from
+        new_filepath = strip_compression_suffix(self.filepath).replace('.ipynb', f'{filepath_postfix}.ipynb')
         if os.path.isabs(new_filepath):
             new_filepath = os.path.relpath(new_filepath)
-        new_filepath = f'{directory}/{new_filepath}'
-        os.makedirs(os.path.dirname(new_filepath), exist_ok=True)
-        with open(new_filepath, 'w') as f:
-            json.dump(update_json, f, indent=4)
+        return f'{directory}/{new_filepath}'
 
+    def to_notebook(self, directory='__nb_states', filepath_postfix='_modified', indent=4, rendered_cells=None) -> str:
+        new_filepath = self.get_notebook_filepath(directory=directory, filepath_postfix=filepath_postfix)
+        _write_atomically(new_filepath, self.to_notebook_str(indent=indent, rendered_cells=rendered_cells))
         return new_filepath
 
     # def remove_answer_key(self):
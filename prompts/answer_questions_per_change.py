@@ -87,9 +87,11 @@ def answer_questions(
     nb_state_t2: NotebookParser,
     questions: List[str],
     # change_explanation: str = None,
+    nb_updates: List[CellEntry] = None, # NOTE: if already known, e.g. from the timeline patch
 ):
     # TODO filter out the updated cells from the vectorstores by retriever
-    nb_updates: List[Tuple[CellEntry, CellEntry]] = nb_state_t1.get_updates(nb_state_t2)
+    if nb_updates is None:
+        nb_updates = nb_state_t1.get_updates(nb_state_t2)
     nb_updates_ids = [nb_update.cell_id for nb_update in nb_updates]
     # nb_ids = [cell['id'] for cell in nb_state_t_minus_1.get_cells()]
     # nb_ids_not_updated = [nb_id for nb_id in nb_ids if nb_id not in nb_updates_ids]
@@ -112,13 +112,14 @@ Previous list of Questions:
 Updated list of Questions:
 """
 
-from parsers.nb_parser import NotebookParser
+from parsers.nb_parser import NotebookParser, CellEntry
 
 def make_questions_prompt(
     nb_state_t_minus_1: NotebookParser,
     nb_state_t: NotebookParser,
     max_num_questions_per_update = 3,
     # change_explanation: str,
+    nb_updates: List[CellEntry] = None, # NOTE: if already known, e.g. from the timeline patch
 ):
     output_parser = StrOutputParser()
 
@@ -128,7 +129,8 @@ def make_questions_prompt(
             'nb_state_t_minus_1', 'nb_updates'
         ]
     )
-    nb_updates = nb_state_t_minus_1.get_updates(nb_state_t)
+    if nb_updates is None:
+        nb_updates = nb_state_t_minus_1.get_updates(nb_state_t)
     nb_updates = [cell.get_json() for cell in nb_updates]
 
     generate_prompt = prompt.partial(**{
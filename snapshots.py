@@ -0,0 +1,124 @@
+import os
+import pickle
+import hashlib
+from parsers.nb_parser import CellEntry, REFORMAT_VERSION, _hash_content
+
+# NOTE: snapshots are only reused by the same code, i.e. the same sources of the modules the snapshotted
+# classes are defined in and the sessions are reconstructed with (packages: all of their modules)
+SNAPSHOTTED_MODULES = ('parsers', 'nb_diff', 'nb_progress', 'nb_timeline', 'utils', 'snapshots')
+_code_version = None
+
+
+def get_code_version() -> str:
+    # hash of the sources of `SNAPSHOTTED_MODULES`, computed once
+    global _code_version
+    if _code_version is None:
+        code_hash = hashlib.blake2b(digest_size=16)
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+        for module_name in SNAPSHOTTED_MODULES:
+            module_path = os.path.join(root_dir, module_name)
+            if os.path.isdir(module_path):
+                filepaths = sorted(
+                    os.path.join(module_path, filename)
+                    for filename in os.listdir(module_path) if filename.endswith('.py')
+                )
+            else:
+                filepaths = [module_path + '.py']
+            for filepath in filepaths:
+                code_hash.update(os.path.relpath(filepath, root_dir).encode())
+                code_hash.update(hash_file(filepath).encode())
+        _code_version = code_hash.hexdigest()
+    return _code_version
+
+
+def hash_file(filepath, chunk_size=1 << 20) -> str:
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _same(obj):
+    return obj
+
+
+class _DedupPickler(pickle.Pickler):
+    # NOTE: shared objects are already pickled once (memo); on top of that, distinct cells
+    # with the same content (e.g. re-applied log entries) are pickled once as well.
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._cells = {}
+
+    def reducer_override(self, obj):
+        if type(obj) is CellEntry:
+            content_hash = _hash_content(obj.cell_type, obj.cell_id, obj._source, obj.fingerprint)
+            canonical_cell = self._cells.setdefault(content_hash, obj)
+            if canonical_cell is not obj:
+                return _same, (canonical_cell,)
+        return NotImplemented
+
+
+def dump_snapshot(obj, filepath, key=None):
+    header = {'code_version': get_code_version(), 'reformat_version': REFORMAT_VERSION, 'key': key}
+    if os.path.dirname(filepath):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_filepath = f'{filepath}.tmp{os.getpid()}'
+    try:
+        with open(tmp_filepath, 'wb') as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            _DedupPickler(f).dump(obj)
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+
+
+def load_snapshot(filepath, key=None):
+    # returns None if there is no snapshot, if it was written for other inputs or code versions,
+    # or if it is corrupt (e.g. truncated), so that it is recomputed
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath, 'rb') as f:
+        try:
+            header = pickle.load(f)
+            if header != {'code_version': get_code_version(), 'reformat_version': REFORMAT_VERSION, 'key': key}:
+                return None
+            return pickle.load(f)
+        except Exception:
+            return None
+
+
+class SnapshotStore:
+    """
+    Directory of snapshots (e.g. parsed notebooks, reconstructed sessions), keyed by the hashes of their
+    input files, parameters and code versions; hence reused only when inputs are unchanged.
+    """
+    def __init__(self, snapshot_dir):
+        self.snapshot_dir = snapshot_dir
+        self._file_hashes = {}
+
+    def _hash_file(self, filepath) -> str:
+        # NOTE: files are hashed once per (size, mtime)
+        stat = os.stat(filepath)
+        cache_key = (filepath, stat.st_size, stat.st_mtime_ns)
+        if cache_key not in self._file_hashes:
+            self._file_hashes[cache_key] = hash_file(filepath)
+        return self._file_hashes[cache_key]
+
+    def make_key(self, kind, input_filepaths, **params) -> str:
+        return _hash_content(
+            get_code_version(), REFORMAT_VERSION, kind,
+            [(filepath, self._hash_file(filepath)) for filepath in input_filepaths],
+            params
+        )
+
+    def _get_filepath(self, kind, key) -> str:
+        return os.path.join(self.snapshot_dir, f'{kind}_{key}.snapshot')
+
+    def load(self, kind, key):
+        return load_snapshot(self._get_filepath(kind, key), key=key)
+
+    def save(self, kind, key, obj):
+        dump_snapshot(obj, self._get_filepath(kind, key), key=key)
@@ -0,0 +1,78 @@
+import os
+import time
+import pytest
+from parsers.log_parser import LogEntry
+from parsers.log_columns import convert_to_ms_bulk, MISSING_TIMESTAMP_MS, ColumnarLogStore, LogCache
+
+TIMESTAMPS = [
+    '2023-11-01T16:00:00.000000',
+    '2023-11-01T16:00:00.999999',
+    '1970-01-01T00:00:00.000001',
+    '2038-01-19T03:14:08.500000',
+    # NOTE: DST transitions (Europe and US), i.e. nonexistent and ambiguous local times
+    '2023-03-26T02:30:00.000000',
+    '2023-10-29T02:30:00.000000',
+    '2023-03-12T02:30:00.250000',
+    '2023-11-05T01:30:00.750000',
+    # NOTE: not naive, or in other formats, i.e. converted per entry
+    '2023-11-01T16:00:00.000000+05:30',
+    '2023-11-01T16:00:00Z',
+    '2023-11-01 16:00:00',
+    '2023-11-01',
+    # NOTE: cannot be converted
+    '2023-02-30T16:00:00.000000',
+    '2023-11-01T16:00:00.000000garbage',
+    '',
+    None,
+]
+
+
+@pytest.fixture(params=['UTC', 'Europe/Paris', 'America/New_York', 'Asia/Kolkata', 'Australia/Lord_Howe'])
+def timezone(request, monkeypatch):
+    monkeypatch.setenv('TZ', request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_convert_to_ms_bulk_matches_entries(timezone):
+    expected_timestamps_ms = []
+    for entry_id, timestamp in enumerate(TIMESTAMPS):
+        timestamp_ms = LogEntry(entry_id, 'TGM', 's', 'u', 'c', 'A.ipynb', 't', timestamp).timestamp_ms
+        expected_timestamps_ms.append(timestamp_ms if isinstance(timestamp_ms, int) else MISSING_TIMESTAMP_MS)
+    assert convert_to_ms_bulk(TIMESTAMPS).tolist() == expected_timestamps_ms
+    assert convert_to_ms_bulk([]).tolist() == []
+
+
+def test_log_cache_is_invalidated_when_the_log_changes(tmp_path, monkeypatch):
+    log_filepath = str(tmp_path / 'subject.log')
+    line = 'CELL_SELECTED:::s:::u:::c:::A.ipynb:::t:::2023-11-01T16:00:00.000000:::x = 1:::code\n'
+    with open(log_filepath, 'w') as f:
+        f.write(line)
+    parsed_log_filepaths = []
+    from_file = ColumnarLogStore.from_file
+
+    def _from_file(filepath):
+        parsed_log_filepaths.append(filepath)
+        return from_file(filepath)
+    monkeypatch.setattr(ColumnarLogStore, 'from_file', _from_file)
+    log_cache = LogCache(str(tmp_path / 'cache'))
+
+    assert len(log_cache.get(log_filepath)) == 1
+    assert len(log_cache.get(log_filepath)) == 1
+    assert len(parsed_log_filepaths) == 1
+    # NOTE: size changed
+    with open(log_filepath, 'a') as f:
+        f.write(line)
+    assert len(log_cache.get(log_filepath)) == 2
+    assert len(parsed_log_filepaths) == 2
+    # NOTE: mtime changed only, i.e. same size
+    with open(log_filepath, 'w') as f:
+        f.write(line.replace('x = 1', 'x = 2') * 2)
+    stat = os.stat(log_filepath)
+    os.utime(log_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert [entry.content for entry in log_cache.get(log_filepath)] == ['x = 2', 'x = 2']
+    assert len(parsed_log_filepaths) == 3
+    assert len(log_cache.get(log_filepath)) == 2
+    assert len(parsed_log_filepaths) == 3
@@ -0,0 +1,68 @@
+import pytest
+from parsers.log_parser import LogParser
+
+LOG_LINES = [
+    'CELL_SELECTED:::s:::u:::c:::A.ipynb:::t:::2023-11-01T16:00:00.000000:::x = 1:::code',
+    'TGM:::s:::u:::c:::A.ipynb:::t:::2023-11-01T16:00:01.000000',
+    'CELL_EXECUTION_BEGIN:::s:::u:::c:::A.ipynb:::t:::2023-11-01T16:00:02.000000:::x = 1:::code',
+    'CELL_SELECTED:::s:::u:::c:::B.ipynb:::t:::2023-11-01T16:00:03.000000:::y = 2:::code',
+    'CELL_EXECUTION_END:::s:::u:::c:::A.ipynb:::t:::2023-11-01T16:00:05.000000:::x = 1:::code',
+]
+
+
+@pytest.fixture
+def log_filepath(tmp_path):
+    filepath = tmp_path / 'subject.log'
+    filepath.write_text('\n'.join(LOG_LINES) + '\n')
+    return str(filepath)
+
+
+def test_session_breaks(log_filepath):
+    report = LogParser(log_filepath).get_session_breaks()
+    assert [(run.first_id, run.last_id) for run in report.runs_per_notebook['A.ipynb']] == [(0, 2), (4, 4)]
+    assert [session_break.idle_ms for session_break in report.get_breaks('A.ipynb')] == [3000]
+
+
+def test_session_breaks_filtered_by_notebook(log_filepath):
+    report = LogParser(log_filepath, notebooks={'A.ipynb'}).get_session_breaks()
+    assert [(run.first_id, run.last_id) for run in report.runs_per_notebook['A.ipynb']] == [(0, 2), (4, 4)]
+
+
+@pytest.mark.parametrize('pushdown', [
+    {'entry_types': ('CELL_SELECTED', 'CELL_EXECUTION_BEGIN', 'CELL_EXECUTION_END')},
+    {'fields': ('entry_type', 'notebook', 'content', 'cell_type')},
+])
+def test_session_breaks_of_filtered_log(log_filepath, pushdown):
+    log_parser = LogParser(log_filepath, **pushdown)
+    with pytest.raises(ValueError):
+        log_parser.get_session_breaks()
+    with pytest.raises(ValueError):
+        log_parser.divide_per_notebook(['A.ipynb'])['A.ipynb'].split_sessions()
+
+
+def test_mapped_views_do_not_materialize_entries(log_filepath):
+    log_parser, mapped_log_parser = LogParser(log_filepath), LogParser(log_filepath, mapped=True)
+    views, mapped_views = log_parser.divide_per_notebook(), mapped_log_parser.divide_per_notebook()
+    assert mapped_log_parser._entries is None
+    for notebook, view in views.items():
+        assert mapped_views[notebook]._entries is None
+        assert [entry._astuple() for entry in mapped_views[notebook]] == [entry._astuple() for entry in view]
+        assert mapped_views[notebook][-1]._astuple() == view[-1]._astuple()
+    assert [entry.id for entry in mapped_log_parser.get_only(entry_type='CELL_SELECTED')] == [0, 3]
+    assert [entry.id for entry in mapped_log_parser.get_filtered(notebook='A.ipynb')] == [3]
+    assert mapped_log_parser._entries is None
+
+
+@pytest.mark.parametrize('parser_kwargs', [{}, {'lazy': True}, {'mapped': True}])
+def test_refresh_returns_only_appended_entries(log_filepath, parser_kwargs):
+    log_parser = LogParser(log_filepath, **parser_kwargs)
+    assert [entry.id for entry in log_parser.get_only(notebook='A.ipynb')] == [0, 1, 2, 4]
+    with open(log_filepath, 'a') as f:
+        f.write(LOG_LINES[3] + '\n' + LOG_LINES[0][:20])
+    assert [entry.id for entry in log_parser.refresh()] == [5]
+    with open(log_filepath, 'a') as f:
+        f.write(LOG_LINES[0][20:] + '\n')
+    assert [entry.content for entry in log_parser.refresh()] == ['x = 1']
+    assert log_parser.refresh() == []
+    assert [entry.id for entry in log_parser.get_only(notebook='A.ipynb')] == [0, 1, 2, 4, 6]
+    assert len(log_parser) == 7
@@ -0,0 +1,85 @@
+import os
+import pytest
+from parsers.log_parser import LogParser
+from parsers.log_sqlite import SQLiteLogParser, ingest_logs
+
+ENTRY_TYPES = ['CELL_SELECTED', 'CELL_EXECUTION_BEGIN', 'CELL_EXECUTION_END', 'TGM']
+NOTEBOOKS = ['A.ipynb', 'B.ipynb', 'C.ipynb']
+# NOTE: more entries than a page of `SQLiteLogStore`
+NUM_ENTRIES = 1000
+
+
+def _log_line(entry_idx):
+    entry_type = ENTRY_TYPES[entry_idx % len(ENTRY_TYPES)]
+    notebook = NOTEBOOKS[(entry_idx // 7) % len(NOTEBOOKS)]
+    line = f'{entry_type}:::s:::u:::c:::{notebook}:::t:::2023-11-01T16:{entry_idx // 60 % 60:02d}:{entry_idx % 60:02d}.000000'
+    if entry_type != 'TGM':
+        line += f':::x = {entry_idx % 13}:::{"markdown" if entry_idx % 5 == 0 else "code"}'
+    return line
+
+
+@pytest.fixture
+def log_filepaths(tmp_path):
+    log_filepath = str(tmp_path / 'subject.log')
+    with open(log_filepath, 'w') as f:
+        f.write('\n'.join(_log_line(entry_idx) for entry_idx in range(NUM_ENTRIES)) + '\n')
+    db_filepath = str(tmp_path / 'logs.db')
+    assert ingest_logs(db_filepath, [log_filepath]) == [log_filepath]
+    return db_filepath, log_filepath
+
+
+def _astuples(entries):
+    return [entry._astuple() for entry in entries]
+
+
+def test_parity_with_log_parser(log_filepaths):
+    db_filepath, log_filepath = log_filepaths
+    log_parser, sqlite_log_parser = LogParser(log_filepath), SQLiteLogParser(db_filepath, log_filepath)
+    assert len(sqlite_log_parser) == NUM_ENTRIES
+    for idx in [255, 256, 0, -1, 512]:
+        assert sqlite_log_parser[idx]._astuple() == log_parser[idx]._astuple()
+    assert _astuples(sqlite_log_parser._store[250:260]) == _astuples(log_parser[250:260])
+    for conditions in [
+        {'entry_type': 'CELL_SELECTED'},
+        {'notebook': ['A.ipynb', 'C.ipynb'], 'cell_type': 'markdown'},
+        {'entry_type': ['TGM'], 'notebook': 'B.ipynb'},
+        {'content': 'x = 3'},
+    ]:
+        assert _astuples(sqlite_log_parser.get_only(**conditions)) == _astuples(log_parser.get_only(**conditions))
+        assert _astuples(sqlite_log_parser.get_filtered(**conditions)) == _astuples(log_parser.get_filtered(**conditions))
+    for entry_id in [0, 255, 256, NUM_ENTRIES - 1, NUM_ENTRIES]:
+        entry, sqlite_entry = log_parser.get_entry_by_id(entry_id), sqlite_log_parser.get_entry_by_id(entry_id)
+        assert (entry and entry._astuple()) == (sqlite_entry and sqlite_entry._astuple())
+
+
+def test_parity_per_notebook_across_pages(log_filepaths):
+    db_filepath, log_filepath = log_filepaths
+    log_parser = LogParser(log_filepath)
+    views = log_parser.divide_per_notebook()
+    sqlite_views = SQLiteLogParser(db_filepath, log_filepath).divide_per_notebook()
+    assert list(sqlite_views) == list(views) == NOTEBOOKS
+    for notebook, view in views.items():
+        sqlite_view = sqlite_views[notebook]
+        assert sqlite_view._entries is None
+        assert len(sqlite_view) == len(view)
+        # NOTE: indexed back and forth across the pages of the view
+        for idx in [0, len(view) - 1, 1, 255, 256, 257, -1, -len(view), len(view) // 2]:
+            assert sqlite_view[idx]._astuple() == view[idx]._astuple()
+        assert _astuples(sqlite_view.iter_entries()) == _astuples(view)
+        with pytest.raises(IndexError):
+            sqlite_view[len(view)]
+        # NOTE: neighbours of the entries of the notebook, from the whole log
+        neighbour_id = view[0].id + 7
+        assert sqlite_view.get_entry_by_id(neighbour_id).notebook != notebook
+        assert sqlite_view.get_entry_by_id(neighbour_id)._astuple() == log_parser.get_entry_by_id(neighbour_id)._astuple()
+
+
+def test_ingesting_unchanged_logs_is_a_noop(log_filepaths):
+    db_filepath, log_filepath = log_filepaths
+    assert ingest_logs(db_filepath, [log_filepath]) == []
+    assert len(SQLiteLogParser(db_filepath, log_filepath)) == NUM_ENTRIES
+    with open(log_filepath, 'a') as f:
+        f.write(_log_line(NUM_ENTRIES) + '\n')
+    assert ingest_logs(db_filepath, [log_filepath]) == [log_filepath]
+    assert len(SQLiteLogParser(db_filepath, log_filepath)) == NUM_ENTRIES + 1
+    assert ingest_logs(db_filepath, [log_filepath], rebuild=True) == [log_filepath]
@@ -0,0 +1,66 @@
+import random
+import pytest
+from nb_diff import diff_lines, EditScript
+
+
+def _lcs_length(a, b):
+    lengths = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a)):
+        for j in range(len(b)):
+            lengths[i + 1][j + 1] = lengths[i][j] + 1 if a[i] == b[j] else max(lengths[i][j + 1], lengths[i + 1][j])
+    return lengths[-1][-1]
+
+
+def _apply(a, b, opcodes):
+    # target rebuilt from the source lines, and the target lines only where the source lines were edited
+    lines = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        lines.extend(a[i1:i2] if tag == 'equal' else b[j1:j2])
+    return lines
+
+
+def _cost(opcodes):
+    return sum(i2 - i1 + j2 - j1 for tag, i1, i2, j1, j2 in opcodes if tag != 'equal')
+
+
+def _random_pairs(num_pairs=500, max_len=8, seed=0):
+    rng = random.Random(seed)
+    for _ in range(num_pairs):
+        yield (
+            [rng.choice('abc') for _ in range(rng.randint(0, max_len))],
+            [rng.choice('abc') for _ in range(rng.randint(0, max_len))],
+        )
+
+
+def test_diff_is_minimal_and_applies():
+    for a, b in _random_pairs():
+        opcodes = diff_lines(a, b)
+        assert _cost(opcodes) == len(a) + len(b) - 2 * _lcs_length(a, b), (a, b)
+        assert _apply(a, b, opcodes) == b, (a, b)
+        # NOTE: opcodes cover both sequences contiguously, as difflib's
+        bounds = [(0, 0)] + [(i2, j2) for _, _, i2, _, j2 in opcodes]
+        assert [(i1, j1) for _, i1, _, j1, _ in opcodes] == bounds[:-1]
+        assert bounds[-1] == (len(a), len(b))
+
+
+def test_max_cost_fallback_to_single_replace():
+    a = ['x = 1', 'a', 'b', 'c', 'd', 'return x']
+    b = ['x = 1', 'e', 'f', 'g', 'return x']
+    assert diff_lines(a, b, max_cost=2) == [('equal', 0, 1, 0, 1), ('replace', 1, 5, 1, 4), ('equal', 5, 6, 4, 5)]
+    assert _apply(a, b, diff_lines(a, b, max_cost=2)) == b
+    assert _cost(diff_lines(a, b)) == 7
+
+
+@pytest.mark.parametrize('lines_before, lines_after, change_type', [
+    (['a', 'b'], ['a', 'b'], 'NONE'),
+    (['a', 'b'], ['a', 'x', 'b', 'y'], 'INSERT'),
+    ([], ['a'], 'INSERT'),
+    (['a', 'x', 'b', 'y'], ['a', 'b'], 'DELETE'),
+    (['a', 'b'], ['a', 'c'], 'UPDATE'),
+    (['a', 'b'], ['x', 'a'], 'UPDATE'),
+])
+def test_change_type(lines_before, lines_after, change_type):
+    edit_script = EditScript.from_lines(lines_before, lines_after)
+    assert edit_script.change_type == change_type
+    assert str(edit_script).split(' ')[0] == change_type
+    assert all(op[0] != 'equal' for op in edit_script)
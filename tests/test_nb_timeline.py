@@ -0,0 +1,112 @@
+import json
+import os
+import zipfile
+import pytest
+from parsers.nb_parser import NotebookParser
+from nb_timeline import NotebookTimeline
+
+SOURCES = ['x = 0', 'x = 1\\ny = 2', 'z = 3', 'x = 4', 'x = 4\\ny = 5', 'z = 6']
+
+
+@pytest.fixture
+def nb_states(tmp_path, monkeypatch):
+    # NOTE: states are written relative to the working directory, see `NotebookParser.get_notebook_filepath`
+    monkeypatch.chdir(tmp_path)
+    cells = [
+        {'cell_type': 'markdown', 'id': 'a', 'metadata': {}, 'source': ['# Title']},
+        {'cell_type': 'code', 'id': 'b', 'execution_count': 1, 'metadata': {}, 'outputs': [], 'source': ['x = 0']},
+        {'cell_type': 'code', 'id': 'c', 'execution_count': None, 'metadata': {}, 'outputs': [], 'source': []},
+    ]
+    with open('nb.ipynb', 'w') as f:
+        json.dump({'cells': cells, 'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}, f)
+    nb_states = [NotebookParser('nb.ipynb')]
+    for step, content in enumerate(SOURCES):
+        cell = nb_states[-1][1 + step % 2]
+        nb_states.append(nb_states[-1].replace_cell_content(cell, content))
+    return nb_states
+
+
+def _make_timeline(nb_states, max_cached_states=2):
+    timeline = NotebookTimeline(nb_states[0], max_cached_states=max_cached_states)
+    for nb_state in nb_states[1:]:
+        timeline.append(nb_state)
+    return timeline
+
+
+def _cells(nb_state):
+    return [cell.get_json(compact=False) for cell in nb_state]
+
+
+def test_materialized_states(nb_states):
+    timeline = _make_timeline(nb_states)
+    assert len(timeline) == len(nb_states)
+    assert [_cells(nb_state) for nb_state in timeline] == [_cells(nb_state) for nb_state in nb_states]
+    # NOTE: in reverse order, i.e. from the base state rather than from a cached one
+    for t in reversed(range(len(nb_states))):
+        assert timeline[t].root_hash == nb_states[t].root_hash
+        assert _cells(timeline[t]) == _cells(nb_states[t])
+
+
+def test_slices_and_negative_indexes(nb_states):
+    timeline = _make_timeline(nb_states)
+    assert timeline[-1].root_hash == nb_states[-1].root_hash
+    assert timeline[-len(nb_states)].root_hash == nb_states[0].root_hash
+    with pytest.raises(IndexError):
+        timeline[len(nb_states)]
+    with pytest.raises(IndexError):
+        timeline[-len(nb_states) - 1]
+    sub_timeline = timeline[2:-1]
+    assert len(sub_timeline) == len(nb_states) - 3
+    assert [nb_state.root_hash for nb_state in sub_timeline] == [nb_state.root_hash for nb_state in nb_states[2:-1]]
+    assert sub_timeline[-1].root_hash == nb_states[-2].root_hash
+    assert len(timeline[3:3]) == 0
+    with pytest.raises(ValueError):
+        timeline[::2]
+
+
+def test_evicted_states_are_materialized_again(nb_states):
+    timeline = _make_timeline(nb_states, max_cached_states=2)
+    for t in range(len(nb_states)):
+        timeline[t]
+        assert len(timeline._cache) <= 2
+    assert 1 not in timeline._cache
+    assert _cells(timeline[1]) == _cells(nb_states[1])
+    assert list(timeline._cache)[-1] == 1
+
+
+def test_diff(nb_states):
+    timeline = _make_timeline(nb_states)
+    for t1 in range(len(nb_states)):
+        for t2 in range(len(nb_states)):
+            expected_diff = nb_states[t1].get_diff(nb_states[t2])
+            assert [
+                (cell_before.fingerprint, cell_after.fingerprint) for cell_before, cell_after in timeline.diff(t1, t2)
+            ] == [
+                (cell_before.fingerprint, cell_after.fingerprint) for cell_before, cell_after in expected_diff
+            ]
+    # NOTE: the first step leaves its cell unchanged
+    with pytest.raises(ValueError):
+        timeline.get_edit_script(0)
+    assert timeline.get_edit_script(1).change_type == 'INSERT'
+    assert timeline.get_edit_script(2).change_type == 'UPDATE'
+
+
+@pytest.mark.parametrize('archived', [False, True])
+def test_write_notebooks(nb_states, archived):
+    timeline = _make_timeline(nb_states)
+    archive_filepath = 'states.zip' if archived else None
+    filepaths = timeline.write_notebooks('out', steps=[0, -1], archive_filepath=archive_filepath)
+    # NOTE: archive members are relative to the directory
+    directory_prefix = '' if archived else 'out/'
+    assert filepaths == [f'{directory_prefix}nb_state_{t}.ipynb' for t in (0, len(nb_states) - 1)]
+    if archived:
+        with zipfile.ZipFile(archive_filepath) as archive:
+            assert archive.namelist() == filepaths
+            nb_jsons = [json.loads(archive.read(filepath)) for filepath in filepaths]
+        assert not os.path.exists('out')
+    else:
+        nb_jsons = []
+        for filepath in filepaths:
+            with open(filepath) as f:
+                nb_jsons.append(json.load(f))
+    assert nb_jsons == [nb_states[0].to_notebook_json(), nb_states[-1].to_notebook_json()]
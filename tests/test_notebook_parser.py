@@ -0,0 +1,49 @@
+import json
+import pytest
+from parsers.nb_parser import NotebookParser, LazyJSONValue
+
+
+def _write_notebook(filepath, first_source, indent=1):
+    cells = [
+        {'cell_type': 'markdown', 'id': 'a', 'metadata': {}, 'source': first_source},
+        {
+            'cell_type': 'code', 'id': 'b', 'execution_count': 1, 'metadata': {'tags': ['x'], 'collapsed': False},
+            'outputs': [
+                {'output_type': 'stream', 'name': 'stdout', 'text': ['1\n', 'caf\u00e9 \u001b[0m a/b\t"q"\n']},
+                {'output_type': 'display_data', 'data': {'image/png': 'iVBORw0KGgo=\n'}, 'metadata': {'x': 1.5}},
+            ],
+            'source': ['print(1)\n'],
+        },
+    ]
+    with open(filepath, 'w') as f:
+        json.dump({'cells': cells, 'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}, f, indent=indent, ensure_ascii=False)
+    return filepath
+
+
+@pytest.mark.parametrize('indent', [1, 4])
+def test_lazy_and_eager_fingerprints_are_equal(tmp_path, indent):
+    # NOTE: written as by nbformat, see `_digest_json_span`
+    filepath = _write_notebook(str(tmp_path / 'nb.ipynb'), ['# Title\n'], indent=indent)
+    eager, lazy = NotebookParser(filepath), NotebookParser(filepath, lazy_outputs=True)
+    assert [cell.fingerprint for cell in lazy] == [cell.fingerprint for cell in eager]
+    assert lazy.root_hash == eager.root_hash
+    assert lazy.get_diff(eager) == []
+
+
+def test_lazy_fingerprints_do_not_load_outputs(tmp_path, monkeypatch):
+    lazy = NotebookParser(_write_notebook(str(tmp_path / 'nb.ipynb'), ['# Title\n']), lazy_outputs=True)
+
+    def _load(self):
+        raise AssertionError(f'{self} was loaded')
+    monkeypatch.setattr(LazyJSONValue, 'load', _load)
+    lazy.root_hash
+    lazy.get_xml()
+    str(lazy)
+
+
+def test_lazy_fingerprints_ignore_offsets(tmp_path):
+    # NOTE: the outputs of the second cell are the same, only at other offsets in the file
+    nb = NotebookParser(_write_notebook(str(tmp_path / 'nb.ipynb'), ['# Title\n']), lazy_outputs=True)
+    moved_nb = NotebookParser(_write_notebook(str(tmp_path / 'moved.ipynb'), ['# A much longer title\n']), lazy_outputs=True)
+    assert nb[1]._outputs.start != moved_nb[1]._outputs.start
+    assert nb[1].fingerprint == moved_nb[1].fingerprint
@@ -0,0 +1,28 @@
+import pytest
+from parsers.nb_parser import _reformat_code_lines_uncached
+from legacy.legacy_nb_parser import reformat_code_lines
+
+# NOTE: own-line comments must stay in the block they were written in, as with the legacy implementation
+CASES = {
+    'if_else': 'if x:\n    a = 1\nelse:\n# c\n    b = 2\n',
+    'before_else': 'if x:\n    a = 1\n# c\nelse:\n    b = 2\n',
+    'elif': 'if x:\n    a = 1\nelif y:\n# c\n    b = 2\n',
+    'elif_chain_else': 'if x:\n    a = 1\nelif y:\n# c1\n    b = 2\nelif z:\n    c = 3\nelse:\n# c2\n    d = 4\n# c3\ne = 5\n',
+    'for_else': 'for i in r:\n    a = 1\nelse:\n# c\n    b = 2\n',
+    'while_else': 'while i:\n    a = 1\nelse:\n# c\n    b = 2\n',
+    'try_finally': 'try:\n    a = 1\nfinally:\n# c\n    b = 2\n',
+    'try_except_else_finally': (
+        'try:\n    a = 1\nexcept A:\n    pass\nexcept B as e:\n# c1\n    pass\nelse:\n# c2\n    b = 2\nfinally:\n# c3\n    c = 3\n'
+    ),
+    'decorator': '@dec\n# c\ndef f():\n    pass\n',
+    'async_decorator': '@dec\n# c\nasync def f():\n    pass\n',
+    'decorators_class': '@dec\n@dec2(1)\n# c\nclass A:\n    pass\n',
+    'multiline_decorator': '@dec(\n    1,\n    2)\n# c1\n@other\n# c2\ndef f(x):\n# c3\n    return x\n',
+    'method_decorator': 'class A:\n    @property\n# c\n    def x(self):\n        return 1\n',
+}
+
+
+@pytest.mark.parametrize('code', CASES.values(), ids=CASES.keys())
+def test_comments_placed_as_legacy(code):
+    source = code.splitlines(keepends=True)
+    assert _reformat_code_lines_uncached(source) == reformat_code_lines(source)
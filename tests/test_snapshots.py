@@ -0,0 +1,27 @@
+import os
+import pytest
+from snapshots import dump_snapshot, load_snapshot
+
+
+class _Unpicklable:
+    def __reduce__(self):
+        raise RuntimeError('cannot be pickled')
+
+
+def test_truncated_snapshot_is_recomputed(tmp_path):
+    filepath = str(tmp_path / 'snapshot.pkl')
+    dump_snapshot({'entries': list(range(100))}, filepath, key='k')
+    assert load_snapshot(filepath, key='k') == {'entries': list(range(100))}
+    assert load_snapshot(filepath, key='other') is None
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    with open(filepath, 'wb') as f:
+        f.write(data[:-20])
+    assert load_snapshot(filepath, key='k') is None
+
+
+def test_failed_dump_leaves_no_temporary_file(tmp_path):
+    filepath = str(tmp_path / 'snapshot.pkl')
+    with pytest.raises(RuntimeError):
+        dump_snapshot(_Unpicklable(), filepath)
+    assert os.listdir(tmp_path) == []
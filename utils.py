@@ -8,11 +8,17 @@ from loguru import logger
 from typing import List
 from parsers.nb_parser import NotebookParser
 from parsers.log_parser import LogParser
-from nb_progress import get_notebook_progress_using_log, InvalidLogError, NotebookStateLogMismatchError, NBStep
+from parsers.compression import strip_compression_suffix
+from nb_progress import (
+    get_notebook_progress_using_log, InvalidLogError, NotebookStateLogMismatchError, NBStep,
+    PROGRESS_ENTRY_TYPES, PROGRESS_LOG_FIELDS
+)
+from nb_timeline import NotebookTimeline
+from snapshots import SnapshotStore
 
 
 class NotebookSession:
-    def __init__(self, nb_parser, nb_states, nb_log_parser=None):
+    def __init__(self, nb_parser, nb_states: NotebookTimeline, nb_log_parser=None):
         self.nb_parser = nb_parser
         self.nb_log_parser = nb_log_parser
         self.nb_states = nb_states
@@ -34,8 +40,9 @@ class NotebookSession:
             _name += '_simulated'
         return _name
 
-    def write_first_last_states(self, output_dir):
+    def write_first_last_states(self, output_dir, all_states=False, archive=False):
         # write notebook first and last states
+        # all_states: additionally write every intermediate state (e.g. for audit), packed into one zip if archive
         first_state = self.nb_states[0]
         last_state = self.nb_states[-1]
         qa_states_dir= f'{output_dir}/qa_pairs_{self.name}'
@@ -43,6 +50,12 @@ class NotebookSession:
         first_state.to_notebook(directory=qa_states_dir, filepath_postfix='_first_state')
         last_state.to_notebook(directory=qa_states_dir, filepath_postfix='_last_state')
         logger.info(f'Wrote to {qa_states_dir} the method names for each column in the csv file')
+        if all_states:
+            states_dir = f'{qa_states_dir}/nb_states'
+            self.nb_states.write_notebooks(
+                states_dir, archive_filepath=f'{states_dir}.zip' if archive else None
+            )
+            logger.info(f'Wrote {len(self.nb_states)} notebook states to {states_dir}{".zip" if archive else ""}')
 
 
 def _apply_offset(nb_states, offset):
@@ -58,12 +71,13 @@ def _apply_offset(nb_states, offset):
         # nb_states = nb_states[int(len(nb_states)*offset):]
     return nb_states
 
-def get_all_file_with_extension_in_dir_recursively(dir_path, extension):
+def get_all_file_with_extension_in_dir_recursively(dir_path, extension, compressed=True):
+    # compressed: compressed variants of the files are listed as well (e.g. `.log.gz`), see `parsers.compression`
     import os
     filepaths = []
     for root, dirs, files in os.walk(dir_path):
         for file in files:
-            if file.endswith(extension):
+            if (strip_compression_suffix(file) if compressed else file).endswith(extension):
                 filepaths.append(os.path.join(root, file))
     return filepaths
 
@@ -102,8 +116,8 @@ def prettify_str(_obj, text_width=120, percentage=1.0):
     else:
         raise Exception(f"Type {type(_obj)} not supported for prettify_str")
 
-def generate_nb_states(nb_progress: List[NBStep], offset=0):
-    nb_states: List[NotebookParser] = []
+def generate_nb_states(nb_progress: List[NBStep], offset=0) -> NotebookTimeline:
+    nb_states = NotebookTimeline()
     for step_i, step in enumerate(nb_progress):
         step.reset()
 
@@ -112,14 +126,10 @@ def generate_nb_states(nb_progress: List[NBStep], offset=0):
         else:
             # prev_msgs = [] # TODO should I reset prev_msgs upon each completed step?
             for change_i, nb_parser_with_change_applied in enumerate(step):
-                nb_states.append(nb_parser_with_change_applied)
+                nb_states.append(nb_parser_with_change_applied, edit_script=step.get_edit_script(change_i))
 
                 if len(nb_states) > 1:
-                    state_t_minus_1 = nb_states[-2]
-                    state_t = nb_states[-1]
-                    if len(state_t) != len(state_t_minus_1):
-                        raise Exception('Invalid number of cells in the notebook states')
-                    nb_diffs = state_t_minus_1.get_diff(state_t)
+                    nb_diffs = nb_states.diff(-2, -1)
                     if len(nb_diffs) != 1:
                         breakpoint()
                         raise Exception('Invalid number of changes in cells of the notebook states')
@@ -127,73 +137,146 @@ def generate_nb_states(nb_progress: List[NBStep], offset=0):
     return _apply_offset(nb_states, offset)
 
 
-def get_selected_logged_sessions(notebooks_dir, logs_dir, min_num_steps=4, offset=0):
+def _get_log_selected_sessions(selected_log_filepath, notebooks_dir, min_num_steps=4, offset=0, log_cache=None, log_db=None):
+    selected_sessions: List[NotebookSession] = []
+    if log_db is not None:
+        from parsers.log_sqlite import SQLiteLogParser
+        log_parser = SQLiteLogParser(log_db, selected_log_filepath)
+    else:
+        # NOTE: only the entries the progress is reconstructed from, of the notebooks that might be attached;
+        # the sessions log parsers are filtered as well, i.e. their session breaks cannot be detected
+        notebooks = {
+            os.path.basename(strip_compression_suffix(nb_filepath))
+            for nb_filepath in get_all_file_with_extension_in_dir_recursively(notebooks_dir, ".ipynb")
+        }
+        log_parser = LogParser(
+            selected_log_filepath, cache=log_cache,
+            entry_types=PROGRESS_ENTRY_TYPES, notebooks=notebooks, fields=PROGRESS_LOG_FIELDS
+        )
+    # NOTE: cells outputs are never used to generate QA pairs, hence not loaded
+    nb_sublog_dict = log_parser.attach_notebooks(notebooks_dir, verbose=False, lazy_outputs=True)
+    # logger.debug(
+    #     'Sample:' +\
+    #     f'\nSelected log file: {selected_log_filepath}' +\
+    #     f'\nfetching notebooks from log file: {notebooks_dir}' +\
+    #     f'\nLog parser per these notebooks:\n{nb_sublog_dict.keys()}'
+    # )
+
+    for i, (nb_filepath, (nb_log_parser, nb_parser)) in enumerate(nb_sublog_dict.items()):
+        try:
+            nb_progress = get_notebook_progress_using_log(nb_parser, nb_log_parser)
+        except InvalidLogError as e:
+            # logger.error(f'@ {i} Exception: {e} with nb_filepath({nb_parser.filepath}) and nb_log_parser({nb_log_parser.filepath})')
+            continue
+        except NotebookStateLogMismatchError as e:
+            # logger.error(f'@ {i} Exception: {e} with nb_filepath({nb_parser.filepath}) and nb_log_parser({nb_log_parser.filepath})')
+            continue
+
+        nb_states = generate_nb_states(nb_progress)
+        nb_states = _apply_offset(nb_states, offset)
+
+        num_progress_steps = len(nb_progress)
+        if num_progress_steps >= min_num_steps:
+            # logger.info(f'Notebook: {nb_parser.filepath}')
+            # logger.info(f'Log: {nb_log_parser.filepath}')
+            # logger.info(f'Number of progress steps: {num_progress_steps}')
+            selected_sessions.append(
+                NotebookSession(nb_parser, nb_states, nb_log_parser)
+            )
+    return selected_sessions
+
+
+def get_selected_logged_sessions(
+    notebooks_dir, logs_dir, min_num_steps=4, offset=0, snapshot_dir=None,
+    log_cache_dir=None, rebuild_log_cache=False, log_db=None
+):
+    # log_db: SQLite database the logs are read from (see `ingest_logs.py`), instead of the logs files
     all_log_filepathes = get_all_file_with_extension_in_dir_recursively(logs_dir, ".log")
     all_log_filepathes.sort()
     # skip files containing baseline
     all_log_filepathes = [log_filepath for log_filepath in all_log_filepathes if "baseline" not in log_filepath]
     logger.success(f'There are {len(all_log_filepathes)} log files in {logs_dir} directory')
 
+    snapshot_store = None if snapshot_dir is None else SnapshotStore(snapshot_dir)
+    log_cache = None
+    if log_db is not None:
+        from parsers.log_sqlite import ingest_logs
+        # NOTE: only the new or changed logs are ingested
+        ingest_logs(log_db, all_log_filepathes)
+    elif log_cache_dir is not None:
+        from parsers.log_columns import LogCache
+        log_cache = LogCache(log_cache_dir, rebuild=rebuild_log_cache)
+    # NOTE: any change of the notebooks might change the sessions reconstructed from a log file
+    all_nb_filepathes = sorted(get_all_file_with_extension_in_dir_recursively(notebooks_dir, ".ipynb"))
+
     selected_sessions: List[NotebookSession] = []
     for selected_log_filepath in all_log_filepathes:
-        log_parser = LogParser(selected_log_filepath).parse()
-        nb_sublog_dict = log_parser.attach_notebooks(notebooks_dir, verbose=False)
-        # logger.debug(
-        #     'Sample:' +\
-        #     f'\nSelected log file: {selected_log_filepath}' +\
-        #     f'\nfetching notebooks from log file: {notebooks_dir}' +\
-        #     f'\nLog parser per these notebooks:\n{nb_sublog_dict.keys()}'
-        # )
-
-        for i, (nb_filepath, (nb_log_parser, nb_parser)) in enumerate(nb_sublog_dict.items()):
-            try:
-                nb_progress = get_notebook_progress_using_log(nb_parser, nb_log_parser)
-            except InvalidLogError as e:
-                # logger.error(f'@ {i} Exception: {e} with nb_filepath({nb_parser.filepath}) and nb_log_parser({nb_log_parser.filepath})')
-                continue
-            except NotebookStateLogMismatchError as e:
-                # logger.error(f'@ {i} Exception: {e} with nb_filepath({nb_parser.filepath}) and nb_log_parser({nb_log_parser.filepath})')
-                continue
-
-            nb_states = generate_nb_states(nb_progress)
-            nb_states = _apply_offset(nb_states, offset)
-
-            num_progress_steps = len(nb_progress)
-            if num_progress_steps >= min_num_steps:
-                # logger.info(f'Notebook: {nb_parser.filepath}')
-                # logger.info(f'Log: {nb_log_parser.filepath}')
-                # logger.info(f'Number of progress steps: {num_progress_steps}')
-                selected_sessions.append(
-                    NotebookSession(nb_parser, nb_states, nb_log_parser)
-                )
+        if snapshot_store is None:
+            selected_sessions += _get_log_selected_sessions(selected_log_filepath, notebooks_dir, min_num_steps, offset, log_cache, log_db)
+            continue
+
+        snapshot_key = snapshot_store.make_key(
+            'logged_sessions', [selected_log_filepath] + all_nb_filepathes,
+            min_num_steps=min_num_steps, offset=offset
+        )
+        log_selected_sessions = snapshot_store.load('logged_sessions', snapshot_key)
+        if log_selected_sessions is None:
+            log_selected_sessions = _get_log_selected_sessions(selected_log_filepath, notebooks_dir, min_num_steps, offset, log_cache, log_db)
+            snapshot_store.save('logged_sessions', snapshot_key, log_selected_sessions)
+        else:
+            logger.debug(f'Loaded sessions of {selected_log_filepath} from snapshot')
+        selected_sessions += log_selected_sessions
     return selected_sessions
 
 import os
 from nb_progress import get_notebook_progress_simulate
-def get_selected_simulated_sessions(notebooks_dir, min_num_steps=4, offset=0):
+def _get_simulated_session(nb_filepath, min_num_steps=4, offset=0):
+    nb_parser = NotebookParser(nb_filepath, lazy_outputs=True)
+    try:
+        nb_progress = get_notebook_progress_simulate(nb_parser)
+    except InvalidLogError as e:
+        logger.error(f'Exception: {e} with nb_filepath({nb_parser.filepath})')
+        return None
+
+    nb_states = generate_nb_states(nb_progress, offset=offset)
+
+    num_progress_steps = len(nb_progress)
+    if num_progress_steps >= min_num_steps:
+        # logger.info(f'Notebook: {nb_parser.filepath}')
+        # logger.info(f'Number of progress steps: {num_progress_steps}')
+        return NotebookSession(nb_parser, nb_states)
+    return None
+
+
+def get_selected_simulated_sessions(notebooks_dir, min_num_steps=4, offset=0, snapshot_dir=None):
     nb_filename_dict = {
-        os.path.basename(nb_filepath): nb_filepath
+        os.path.basename(strip_compression_suffix(nb_filepath)): nb_filepath
         for nb_filepath in
         get_all_file_with_extension_in_dir_recursively(notebooks_dir, ".ipynb")
     }
 
     logger.success(f'There are {len(nb_filename_dict)} notebooks found in {notebooks_dir} directory')
 
-    selected_sessions = []
-    for i, nb_parser in enumerate(map(NotebookParser, nb_filename_dict.values())):
-        try:
-            nb_progress = get_notebook_progress_simulate(nb_parser)
-        except InvalidLogError as e:
-            logger.error(f'@ {i} Exception: {e} with nb_filepath({nb_parser.filepath})')
-            continue
+    snapshot_store = None if snapshot_dir is None else SnapshotStore(snapshot_dir)
 
-        nb_states = generate_nb_states(nb_progress, offset=offset)
-
-        num_progress_steps = len(nb_progress)
-        if num_progress_steps >= min_num_steps:
-            # logger.info(f'Notebook: {nb_parser.filepath}')
-            # logger.info(f'Number of progress steps: {num_progress_steps}')
-            selected_sessions.append(
-                NotebookSession(nb_parser, nb_states)
+    selected_sessions = []
+    for nb_filepath in nb_filename_dict.values():
+        if snapshot_store is None:
+            nb_session = _get_simulated_session(nb_filepath, min_num_steps, offset)
+        else:
+            snapshot_key = snapshot_store.make_key(
+                'simulated_session', [nb_filepath],
+                min_num_steps=min_num_steps, offset=offset
             )
-    return selected_sessions
\ No newline at end of file
+            # NOTE: a notebook without any selected session is snapshotted as an empty list
+            nb_sessions = snapshot_store.load('simulated_session', snapshot_key)
+            if nb_sessions is None:
+                nb_session = _get_simulated_session(nb_filepath, min_num_steps, offset)
+                snapshot_store.save('simulated_session', snapshot_key, [] if nb_session is None else [nb_session])
+            else:
+                logger.debug(f'Loaded session of {nb_filepath} from snapshot')
+                nb_session = nb_sessions[0] if nb_sessions else None
+
+        if nb_session is not None:
+            selected_sessions.append(nb_session)
+    return selected_sessions